@@ -3,7 +3,8 @@ import shutil
 import tempfile
 import pandas as pd
 import streamlit as st
-from predict import IOTagger
+from tagger_registry import get_tagger, registry
+from predict import download_model, model_installed
 import base64
 
 # __order__ = 8
@@ -249,19 +250,24 @@ def app():
                 )
 
         # Hidden model configuration - 自动下载模型
-        import requests
-
-        MODEL_URL = "https://github.com/PseudoInsider/autoRecognition/releases/download/v1.0/V1-model.bin"
         MODEL_PATH = "V1-model.bin"
-
-        # 如果本地没有模型，就从 GitHub Release 下载
-        if not os.path.exists(MODEL_PATH):
-            with st.spinner("正在从 GitHub Release 下载模型，请稍候..."):
-                response = requests.get(MODEL_URL, stream=True)
-                response.raise_for_status()   # ✅ 新增，确保下载失败时抛错
-            with open(MODEL_PATH, "wb") as f:
-                shutil.copyfileobj(response.raw, f)
-            del response
+        # 跨会话、跨运行共享的预测缓存
+        CACHE_PATH = "prediction_cache.sqlite"
+
+        # 如果本地没有模型，就从 GitHub Release 下载，并把分词器保存在模型旁边
+        # 分段并行、断点续传、校验后原子替换；多个会话同时打开时只下载一次
+        if not model_installed(MODEL_PATH):
+            download_bar = st.progress(0.0, text="正在从 GitHub Release 下载模型，请稍候...")
+            try:
+                download_model(MODEL_PATH,
+                               progress=lambda done, total: download_bar.progress(
+                                   min(done / total, 1.0) if total else 0.0,
+                                   text=f"正在下载模型 {done / 2 ** 20:.0f}/{(total or 0) / 2 ** 20:.0f} MB"))
+            except Exception as e:
+                st.error(f"❌ 模型下载失败（可刷新页面断点续传）: {e}")
+                st.stop()
+            finally:
+                download_bar.empty()
             st.success("模型下载完成！")
 
         # Centered analysis button with processing logic
@@ -288,23 +294,27 @@ def app():
                 status_text = st.empty()
 
                 try:
-                    # Initialize analyzer
-                    tagger = IOTagger(model_path=MODEL_PATH)
+                    # Shared analyzer: loaded once per process, reused by every session and rerun
+                    tagger = get_tagger(MODEL_PATH, cache=CACHE_PATH)
 
-                    # Simulation of analysis process
-                    for percent in range(100):
-                        # Update progress
-                        progress_bar.progress(percent + 1)
-                        status_text.text(f"{progress_text} {percent + 1}%")
+                    # Progress driven by the tagger: rows done, sentences/s and time left
+                    def report_progress(done, total, rate, eta):
+                        progress_bar.progress(done / total if total else 1.0, text=progress_text)
+                        eta_text = f"预计剩余 {eta:.0f} 秒" if eta is not None else "估算中..."
+                        status_text.text(f"已完成 {done}/{total} 句 | {rate:.1f} 句/秒 | {eta_text}")
 
-                        # Actual processing at the end
-                        if percent == 99:
-                            results = tagger.predict_dataset(input_csv=input_csv)
-                            st.session_state.predicted_data = pd.DataFrame(results)
+                    # Small chunks so the bar moves while inference runs
+                    results = tagger.predict_dataset(input_csv=input_csv,
+                                                     chunk_size=max(tagger.batch_size * 4, 32),
+                                                     progress=report_progress)
+                    st.session_state.predicted_data = pd.DataFrame(results)
 
                     # Success notification
                     st.balloons()
                     status_text.success("✅ 分析完成! 结果已准备就绪")
+                    cache_stats = tagger.cache.stats()
+                    st.caption(f"模型常驻内存: {registry.memory_report()['rss_mb']:.0f} MB | "
+                               f"缓存命中率: {cache_stats['hit_rate']:.0%} ({cache_stats['entries']} 条)")
 
                 except Exception as e:
                     st.error(f"⚠️ 分析中断: {str(e)}")
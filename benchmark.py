@@ -0,0 +1,594 @@
+"""Benchmarks for the tagging stage.
+
+    python benchmark.py shared-weights --workers 4
+    python benchmark.py load-test --url http://127.0.0.1:8765 --requests 500 --concurrency 32
+    python benchmark.py compiled --batch-sizes 1 4 16
+    python benchmark.py suite --output bench.json [--baseline bench-baseline.json]
+    python benchmark.py compare bench.json bench-baseline.json --tolerance 0.1
+    python benchmark.py preprocess --input-directory test_data
+    python benchmark.py download --size-mb 8
+
+shared-weights starts N worker processes that each build IOTagger(shared_weights=True)
+and tag a few sentences, then reads every worker's proportional set size (PSS, which
+splits shared pages between the processes mapping them) and how much of the checkpoint
+mapping each worker has resident. Exits non-zero when memory does not grow sublinearly.
+
+load-test sends concurrent POST /tag requests to a running tagging_service and reports
+throughput and p50/p95/p99 request latency.
+
+compiled times forward_batch over the test_data reporting sentences for the eager model
+and for IOTagger(compile_lengths=...) at each batch size, and reports per-batch latency.
+
+suite runs every backend x thread count in its own process (so model load time and peak
+RSS are clean) over the test_data reporting sentences scaled up --scale times, and over
+synthetic encodings of each --lengths bucket, at every batch size. Each row records
+sentences/s, p50/p99 batch latency, peak RSS and load time; the JSON file also holds the
+machine and library versions. compare (or suite --baseline) flags rows that are worse
+than a saved baseline by more than --tolerance and exits non-zero.
+
+preprocess runs PreprocessText over --input-directory with and without the lexical
+prefilter, and reports the fraction of sentences skipped, the end-to-end speedup and
+whether both runs wrote the same output.csv.
+
+download checks downloader.download against a local stand-in HTTP server: resuming
+after truncated responses and after an interrupted run, a checksum mismatch, a server
+without range support, signed redirect targets that expire mid-download, and two
+processes downloading the same file at once. Exits non-zero when any scenario fails.
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing as mp
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import numpy as np
+import pandas as pd
+import psutil
+import torch
+
+from downloader import DownloadError, download as download_file
+from evaluate_backends import add_reference_arguments, reference_sentences
+from predict import IOTagger, ensure_mmap_checkpoint
+from prediction_cache import file_sha256
+from preprocessing import PreprocessText
+
+
+SAMPLE_SENTENCES = [
+    'President Christine Lagarde said that ECB policy is still "restrictive".',
+    "The company told investors it would cut 300 jobs, according to a filing.",
+    "Officials warned that the freeze could halt aid deliveries within weeks.",
+]
+
+
+def shared_weights_worker(model_path, ready, done):
+    tagger = IOTagger(model_path=model_path, shared_weights=True)
+    tagger.predict_sentences(SAMPLE_SENTENCES)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def process_memory(pid, checkpoint_path):
+    """PSS of the whole process, and RSS/PSS of its mapping of the checkpoint file"""
+    process = psutil.Process(pid)
+    checkpoint = os.path.realpath(checkpoint_path)
+    mapped = [m for m in process.memory_maps(grouped=True) if os.path.realpath(m.path) == checkpoint]
+    return {
+        "pss": process.memory_full_info().pss,
+        "weights_rss": sum(m.rss for m in mapped),
+        "weights_pss": sum(m.pss for m in mapped),
+    }
+
+
+def measure_workers(model_path, workers):
+    """Start `workers` processes, wait until all have run inference, and sum their memory"""
+    context = mp.get_context("spawn")
+    ready, done = context.Queue(), context.Event()
+    processes = [context.Process(target=shared_weights_worker, args=(model_path, ready, done))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        pids = [ready.get(timeout=600) for _ in processes]
+        checkpoint_path = ensure_mmap_checkpoint(model_path)
+        usage = [process_memory(pid, checkpoint_path) for pid in pids]
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+    return {key: sum(u[key] for u in usage) for key in ("pss", "weights_rss", "weights_pss")}
+
+
+def shared_weights(args):
+    single = measure_workers(args.model_path, 1)
+    multiple = measure_workers(args.model_path, args.workers)
+
+    mb = 2 ** 20
+    print(f"{'workers':>8} {'total PSS MB':>13} {'weights RSS MB':>15} {'weights PSS MB':>15}")
+    for count, usage in ((1, single), (args.workers, multiple)):
+        print(f"{count:>8} {usage['pss'] / mb:>13.1f} {usage['weights_rss'] / mb:>15.1f} "
+              f"{usage['weights_pss'] / mb:>15.1f}")
+
+    # Shared pages: N workers together account for about one copy of the weights
+    weights_shared = multiple["weights_pss"] <= 1.1 * single["weights_pss"] + mb
+    sublinear = multiple["pss"] < args.workers * single["pss"]
+    print(f"weights shared: {weights_shared}, total memory sublinear: {sublinear}")
+    return 0 if weights_shared and sublinear else 1
+
+
+async def send_requests(url, sentences, total, concurrency, per_request):
+    """Latency in seconds of every successful request, and the number that failed"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(session, i):
+        nonlocal failures
+        batch = [sentences[(i * per_request + j) % len(sentences)] for j in range(per_request)]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/tag", json={"sentences": batch}) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(one(session, i) for i in range(total)))
+        async with session.get(f"{url}/health") as response:
+            health = await response.json()
+    return latencies, failures, health
+
+
+def load_test(args):
+    if args.input_csv:
+        sentences = reference_sentences(args.input_csv)
+    else:
+        sentences = SAMPLE_SENTENCES
+
+    start = time.perf_counter()
+    latencies, failures, health = asyncio.run(
+        send_requests(args.url.rstrip("/"), sentences, args.requests, args.concurrency, args.sentences_per_request))
+    seconds = time.perf_counter() - start
+
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        print(f"{len(latencies)} ok / {failures} failed in {seconds:.2f}s: "
+              f"{len(latencies) / seconds:.1f} req/s, "
+              f"{len(latencies) * args.sentences_per_request / seconds:.1f} sentences/s")
+        print(f"latency ms  p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}")
+    print(f"server: {health['batches']} batches, {health['mean_batch_sentences']:.1f} sentences per batch, "
+          f"{health['rejected']} rejected")
+    return 0 if latencies and not failures else 1
+
+
+def batch_latencies(tagger, encodings, repeats):
+    """Seconds per forward_batch call over the tagger's own length buckets"""
+    batches = [[encodings[i] for i in batch]
+               for batch in tagger.length_buckets([len(ids) for ids in encodings])]
+    tagger.forward_batch(batches[0])
+    latencies = []
+    for _ in range(repeats):
+        for batch in batches:
+            start = time.perf_counter()
+            tagger.forward_batch(batch)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def compiled(args):
+    sentences = reference_sentences(args.input_csv, args.input_directory, args.limit)
+    print(f"{'batch':>5} {'mode':>8} {'load s':>7} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'speedup':>7}")
+    for batch_size in args.batch_sizes:
+        eager_mean = None
+        for mode, options in (("eager", {}), ("compiled", {"compile_lengths": args.lengths})):
+            start = time.perf_counter()
+            tagger = IOTagger(model_path=args.model_path, batch_size=batch_size, **options)
+            load_seconds = time.perf_counter() - start
+            encodings = tagger.tokenize(sentences)["input_ids"]
+            latencies = np.array(batch_latencies(tagger, encodings, args.repeats)) * 1000
+            mean = latencies.mean()
+            eager_mean = eager_mean or mean
+            print(f"{batch_size:>5} {mode:>8} {load_seconds:>7.1f} {mean:>8.2f} "
+                  f"{np.percentile(latencies, 50):>7.2f} {np.percentile(latencies, 95):>7.2f} "
+                  f"{eager_mean / mean:>6.2f}x")
+            del tagger
+    return 0
+
+
+def bucket_encodings(encodings, length, count):
+    """`count` synthetic encodings of exactly `length` tokens, cycling through real content tokens"""
+    content = [token for ids in encodings for token in ids[1:-1]]
+    bos, eos = encodings[0][0], encodings[0][-1]
+    width = length - 2
+    return [[bos] + [content[(i * width + k) % len(content)] for k in range(width)] + [eos]
+            for i in range(count)]
+
+
+def measure(tagger, encodings):
+    """Sentences/s and per-batch latency of forward_batch over the tagger's length buckets"""
+    latencies = np.array(batch_latencies(tagger, encodings, repeats=1)) * 1000
+    return {
+        "sentences": len(encodings),
+        "sentences_per_s": len(encodings) / (latencies.sum() / 1000),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def suite_worker(args, backend, threads, sentences, results):
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    tagger = IOTagger(model_path=args.model_path, backend=backend)
+    load_seconds = time.perf_counter() - start
+    encodings = tagger.tokenize(sentences)["input_ids"]
+    workloads = [("reference", encodings * args.scale)]
+    workloads += [(f"len-{length}", bucket_encodings(encodings, length, args.bucket_size))
+                  for length in args.lengths if length <= tagger.max_length]
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        tagger.batch_size = batch_size
+        for workload, workload_encodings in workloads:
+            rows.append({"backend": backend, "threads": threads, "batch_size": batch_size,
+                         "workload": workload, "load_s": load_seconds,
+                         **measure(tagger, workload_encodings)})
+    # ru_maxrss is in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put([{**row, "peak_rss_mb": peak_rss_mb} for row in rows])
+
+
+def row_key(row):
+    return row["backend"], row["threads"], row["batch_size"], row["workload"]
+
+
+# Metric -> True when larger is better
+COMPARED_METRICS = {"sentences_per_s": True, "p99_ms": False, "peak_rss_mb": False, "load_s": False}
+
+
+def find_regressions(results, baseline, tolerance):
+    """(row key, metric, baseline value, new value) for every metric worse than tolerance allows"""
+    previous = {row_key(row): row for row in baseline["results"]}
+    regressions = []
+    for row in results["results"]:
+        old = previous.get(row_key(row))
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            change = (row[metric] - old[metric]) / max(abs(old[metric]), 1e-9)
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append((row_key(row), metric, old[metric], row[metric]))
+    return regressions
+
+
+def report_regressions(results, baseline, tolerance):
+    regressions = find_regressions(results, baseline, tolerance)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {'/'.join(map(str, key))} {metric}: {old:.2f} -> {new:.2f}")
+    print(f"{len(regressions)} regressions beyond {tolerance:.0%} against the baseline")
+    return 1 if regressions else 0
+
+
+def suite(args):
+    sentences = reference_sentences(args.input_csv, args.input_directory, args.limit)
+    context = mp.get_context("spawn")
+    results = context.Queue()
+    rows = []
+    for backend in args.backends:
+        for threads in args.threads:
+            process = context.Process(target=suite_worker, args=(args, backend, threads, sentences, results))
+            process.start()
+            batch = results.get()
+            process.join()
+            for row in batch:
+                print(f"{row['backend']:>9} {row['threads']:>3}t bs{row['batch_size']:<3} {row['workload']:>9}: "
+                      f"{row['sentences_per_s']:8.1f} sent/s  p50 {row['p50_ms']:7.1f} ms  "
+                      f"p99 {row['p99_ms']:7.1f} ms  rss {row['peak_rss_mb']:6.0f} MB  load {row['load_s']:.1f}s")
+            rows.extend(batch)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "model_path": args.model_path,
+            "reference_sentences": len(sentences),
+        },
+        "results": rows,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"✅ Results saved to '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            return report_regressions(output, json.load(f), args.tolerance)
+    return 0
+
+
+def compare(args):
+    with open(args.results, encoding="utf-8") as f:
+        results = json.load(f)
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    return report_regressions(results, baseline, args.tolerance)
+
+
+def timed_preprocess(args, **options):
+    """(seconds, output rows, preprocessor) for one PreprocessText run over the input directory"""
+    config = {
+        'context_range': 3,
+        'max_merge': 3,
+        'reporting_verbs_file': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reporting_verbs.csv'),
+        'output_directory': tempfile.mkdtemp(),
+        'input_directory': os.path.abspath(args.input_directory),
+        'batch_size': args.batch_size,
+        'n_process': args.n_process,
+        **options,
+    }
+    preprocessor = PreprocessText(config)
+    start = time.perf_counter()
+    preprocessor.preprocess_text()
+    seconds = time.perf_counter() - start
+    output_csv = os.path.join(config['output_directory'], "output.csv")
+    rows = pd.read_csv(output_csv) if os.path.exists(output_csv) else pd.DataFrame()
+    return seconds, rows, preprocessor
+
+
+def preprocess(args):
+    full_seconds, full_rows, _ = timed_preprocess(args, prefilter=False)
+    seconds, rows, preprocessor = timed_preprocess(args, prefilter=True)
+
+    stats = preprocessor.prefilter_stats
+    same = rows.equals(full_rows)
+    print(f"sentences          : {stats['sentences']}")
+    print(f"skipped by prefilter: {stats['skipped']} ({stats['skipped'] / max(stats['sentences'], 1):.1%})")
+    print(f"without prefilter  : {full_seconds:.1f}s")
+    print(f"with prefilter     : {seconds:.1f}s ({full_seconds / seconds:.2f}x)")
+    print(f"identical output   : {same} ({len(rows)} vs {len(full_rows)} reporting sentences)")
+    return 0 if same else 1
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves server.payload like a release host: optional byte ranges, signed redirects, faults"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def send_empty(self, status, **headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def respond(self, body):
+        server = self.server
+        # /asset redirects to a URL that stops working signed_ttl seconds later, like GitHub's asset links
+        if self.path == "/asset" and server.signed_ttl is not None:
+            return self.send_empty(302, Location=f"/signed/{time.monotonic() + server.signed_ttl}")
+        if self.path.startswith("/signed/") and time.monotonic() > float(self.path.rsplit("/", 1)[1]):
+            return self.send_empty(403)
+
+        payload = server.payload
+        start, end, status = 0, len(payload) - 1, 200
+        if server.ranges and self.headers.get("Range"):
+            start, end = (int(value) for value in self.headers["Range"].split("=", 1)[1].split("-"))
+            status = 206
+        self.send_response(status)
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not body:
+            return
+
+        with server.lock:
+            server.gets += 1
+            truncate = server.truncate_every and server.gets % server.truncate_every == 0
+        data = payload[start:end + 1]
+        if truncate:
+            # Promise the full length, send half and hang up
+            data = data[:len(data) // 2]
+            self.close_connection = True
+        for i in range(0, len(data), 64 << 10):
+            self.wfile.write(data[i:i + (64 << 10)])
+            with server.lock:
+                server.bytes_sent += len(data[i:i + (64 << 10)])
+            if server.chunk_delay:
+                time.sleep(server.chunk_delay)
+
+
+@contextmanager
+def stand_in_server(payload, ranges=True, truncate_every=0, signed_ttl=None, chunk_delay=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.payload = payload
+    server.ranges = ranges
+    server.truncate_every = truncate_every
+    server.signed_ttl = signed_ttl
+    server.chunk_delay = chunk_delay
+    server.lock = threading.Lock()
+    server.gets = 0
+    server.bytes_sent = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}/asset"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def download_worker(url, path, sha256, part_size, results):
+    try:
+        download_file(url, path, sha256=sha256, part_size=part_size)
+        results.put(file_sha256(path) == sha256)
+    except Exception as exc:
+        print(f"worker {os.getpid()} failed: {exc}")
+        results.put(False)
+
+
+def check_downloads(args):
+    """(scenario, passed, detail) for every downloader scenario"""
+    payload = os.urandom(args.size_mb << 20)
+    digest = hashlib.sha256(payload).hexdigest()
+    part_size = max(len(payload) // 8, 1)
+    checks = []
+
+    def run(directory, url, **options):
+        path = os.path.join(directory, "model.bin")
+        try:
+            download_file(url, path, sha256=digest, part_size=part_size, **options)
+        except Exception as exc:
+            print(f"download failed: {exc}")
+            return False
+        return file_sha256(path) == digest
+
+    with tempfile.TemporaryDirectory() as directory, stand_in_server(payload, truncate_every=3) as (server, url):
+        ok = run(directory, url)
+        checks.append(("truncated responses retried", ok, f"{server.gets} GETs for 8 ranges"))
+
+    with tempfile.TemporaryDirectory() as directory, stand_in_server(payload, truncate_every=4) as (server, url):
+        path = os.path.join(directory, "model.bin")
+        try:
+            download_file(url, path, sha256=digest, workers=1, part_size=part_size, retries=0)
+            interrupted = False
+        except Exception:
+            interrupted = True
+        server.truncate_every, first_run = 0, server.bytes_sent
+        ok = interrupted and run(directory, url, workers=1) and server.bytes_sent - first_run < len(payload)
+        checks.append(("resume after interrupted run", ok,
+                       f"second run fetched {(server.bytes_sent - first_run) / len(payload):.0%} of the file"))
+
+    with tempfile.TemporaryDirectory() as directory, stand_in_server(payload) as (server, url):
+        path = os.path.join(directory, "model.bin")
+        try:
+            download_file(url, path, sha256="0" * 64, part_size=part_size)
+            ok = False
+        except DownloadError:
+            ok = not os.path.exists(path) and not os.path.exists(path + ".part")
+        checks.append(("checksum mismatch rejected", ok, "no file or .part left behind" if ok else ""))
+
+    with tempfile.TemporaryDirectory() as directory, stand_in_server(payload, ranges=False) as (server, url):
+        ok = run(directory, url)
+        checks.append(("server without range support", ok, f"{server.gets} GET"))
+
+    # Ranges take longer than the redirect target lives, so each one must be signed afresh
+    delay = 2 * 0.25 / max(part_size >> 16, 1)
+    with tempfile.TemporaryDirectory() as directory, \
+            stand_in_server(payload, signed_ttl=0.25, chunk_delay=delay) as (server, url):
+        ok = run(directory, url, workers=2)
+        checks.append(("expiring signed redirects", ok, f"{server.gets} GETs"))
+
+    with tempfile.TemporaryDirectory() as directory, \
+            stand_in_server(payload, chunk_delay=0.002) as (server, url):
+        context = mp.get_context("spawn")
+        results = context.Queue()
+        path = os.path.join(directory, "model.bin")
+        workers = [context.Process(target=download_worker, args=(url, path, digest, part_size, results))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        ok = all(results.get(timeout=5) for _ in workers) and server.bytes_sent == len(payload)
+        checks.append(("two concurrent callers", ok,
+                       f"server sent {server.bytes_sent / len(payload):.2f}x the file"))
+    return checks
+
+
+def download(args):
+    checks = check_downloads(args)
+    width = max(len(name) for name, _, _ in checks)
+    for name, ok, detail in checks:
+        print(f"{name:<{width}} {'ok' if ok else 'FAILED':<6} {detail}")
+    return 0 if all(ok for _, ok, _ in checks) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the tagging stage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    shared = subparsers.add_parser("shared-weights", help="memory of N workers sharing mmap'd weights")
+    shared.add_argument("--model-path", default="V1-model.bin")
+    shared.add_argument("--workers", type=int, default=4)
+    shared.set_defaults(func=shared_weights)
+
+    load = subparsers.add_parser("load-test", help="latency percentiles against a running tagging_service")
+    load.add_argument("--url", default="http://127.0.0.1:8765")
+    load.add_argument("--requests", type=int, default=500)
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--sentences-per-request", type=int, default=1)
+    load.add_argument("--input-csv", default=None, help="take sentences from ReportingSentence")
+    load.set_defaults(func=load_test)
+
+    traced = subparsers.add_parser("compiled", help="per-batch latency of eager vs traced inference")
+    add_reference_arguments(traced)
+    traced.add_argument("--limit", type=int, default=200)
+    traced.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    traced.add_argument("--lengths", type=int, nargs="+", default=[32, 64, 128, 256, 512])
+    traced.add_argument("--repeats", type=int, default=3)
+    traced.set_defaults(func=compiled)
+
+    bench = subparsers.add_parser("suite", help="throughput, latency, memory and load time across configurations")
+    add_reference_arguments(bench)
+    bench.add_argument("--limit", type=int, default=None)
+    bench.add_argument("--scale", type=int, default=4, help="repeat the reference sentences this many times")
+    bench.add_argument("--backends", nargs="+", default=["torch", "quantized", "onnx"])
+    bench.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count()])
+    bench.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    bench.add_argument("--lengths", type=int, nargs="+", default=[32, 64, 128, 256, 512])
+    bench.add_argument("--bucket-size", type=int, default=64, help="synthetic sentences per length bucket")
+    bench.add_argument("--output", default="bench.json")
+    bench.add_argument("--baseline", default=None)
+    bench.add_argument("--tolerance", type=float, default=0.1)
+    bench.set_defaults(func=suite)
+
+    check = subparsers.add_parser("compare", help="flag regressions of a results file against a baseline")
+    check.add_argument("results")
+    check.add_argument("baseline")
+    check.add_argument("--tolerance", type=float, default=0.1)
+    check.set_defaults(func=compare)
+
+    parse = subparsers.add_parser("preprocess", help="PreprocessText with and without the lexical prefilter")
+    parse.add_argument("--input-directory", default="test_data")
+    parse.add_argument("--batch-size", type=int, default=64)
+    parse.add_argument("--n-process", type=int, default=1)
+    parse.set_defaults(func=preprocess)
+
+    fetch = subparsers.add_parser("download", help="downloader against a local stand-in server")
+    fetch.add_argument("--size-mb", type=int, default=8)
+    fetch.set_defaults(func=download)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Distil the V1 tagger into a smaller student that IOTagger can load.
+
+    python distill.py --input-csv output/output.csv --student-layers 6 --output-path student-model.bin
+    python -c "from predict import IOTagger; IOTagger(model_path='student-model.bin')"
+
+The student keeps roberta-large's width and 6-label head but only every k-th encoder
+layer, initialised from the teacher's own weights, and is trained on the teacher's
+soft token probabilities over the sentences PreprocessText produces. Its config is
+written next to the checkpoint (student-model-config.json), which IOTagger picks up.
+Held-out rows are scored against the teacher's labels with seqeval.
+"""
+import argparse
+import copy
+import random
+import re
+
+import torch
+import torch.nn.functional as F
+from seqeval.metrics import classification_report, f1_score
+from transformers.modeling_utils import no_init_weights
+
+from evaluate_backends import add_reference_arguments, reference_sentences, split_held_out
+from predict import IOTagger, RoBERTaTokenClassifier, pad_ids, save_checkpoint
+
+
+def teacher_targets(teacher, sentences):
+    """Input ids and the teacher's per-token probabilities for every sentence"""
+    encodings = teacher.tokenize(sentences)["input_ids"]
+    outputs = teacher.predict_sentences(sentences, encodings, full_probabilities=True)
+    return [(ids, probabilities) for ids, (_, probabilities) in zip(encodings, outputs)]
+
+
+def kept_layers(teacher_layers, student_layers):
+    """Evenly spaced teacher layers, always including the last one"""
+    return [round((i + 1) * teacher_layers / student_layers) - 1 for i in range(student_layers)]
+
+
+def build_student(teacher_model, student_layers):
+    """Copy embeddings, head and a subset of encoder layers from the teacher"""
+    config = copy.deepcopy(teacher_model.roberta.config)
+    keep = kept_layers(config.num_hidden_layers, student_layers)
+    config.num_hidden_layers = student_layers
+    with no_init_weights():
+        student = RoBERTaTokenClassifier(num_labels=teacher_model.classifier.out_features, config=config)
+
+    state_dict = {}
+    for name, tensor in teacher_model.state_dict().items():
+        match = re.match(r"roberta\.encoder\.layer\.(\d+)\.(.*)", name)
+        if match is None:
+            state_dict[name] = tensor.clone()
+        elif int(match.group(1)) in keep:
+            state_dict[f"roberta.encoder.layer.{keep.index(int(match.group(1)))}.{match.group(2)}"] = tensor.clone()
+    student.load_state_dict(state_dict)
+    return student
+
+
+def collate(examples, pad_id):
+    input_ids, attention_mask = pad_ids([ids for ids, _ in examples], pad_id)
+    targets = torch.zeros((*input_ids.shape, examples[0][1].shape[-1]))
+    for row, (ids, probabilities) in enumerate(examples):
+        targets[row, :len(ids)] = torch.from_numpy(probabilities)
+    return input_ids, attention_mask, targets
+
+
+def distillation_loss(student_logits, teacher_probabilities, attention_mask, temperature=2.0, alpha=0.5):
+    """Temperature-scaled KL to the teacher's soft labels plus cross-entropy on its argmax"""
+    mask = attention_mask.bool()
+    student_logits = student_logits[mask]
+    teacher_probabilities = teacher_probabilities[mask]
+
+    soft_targets = F.softmax(torch.log(teacher_probabilities.clamp_min(1e-8)) / temperature, dim=-1)
+    soft_loss = F.kl_div(F.log_softmax(student_logits / temperature, dim=-1), soft_targets,
+                         reduction="batchmean") * temperature ** 2
+    hard_loss = F.cross_entropy(student_logits, teacher_probabilities.argmax(dim=-1))
+    return alpha * soft_loss + (1 - alpha) * hard_loss
+
+
+def train_student(student, examples, pad_id, epochs=3, batch_size=16, learning_rate=5e-5,
+                  temperature=2.0, alpha=0.5):
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate)
+    student.train()
+    for epoch in range(epochs):
+        random.shuffle(examples)
+        total = 0.0
+        for i in range(0, len(examples), batch_size):
+            input_ids, attention_mask, targets = collate(examples[i:i + batch_size], pad_id)
+            logits = student(input_ids, attention_mask=attention_mask)
+            loss = distillation_loss(logits, targets, attention_mask, temperature, alpha)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item()
+        print(f"epoch {epoch + 1}/{epochs}: loss {total / max(1, -(-len(examples) // batch_size)):.4f}")
+    student.eval()
+    return student
+
+
+def label_sequences(tagger, outputs, encodings):
+    """seqeval label sequences without the <s>/</s> positions"""
+    return [[tagger.id2label[int(label)] for label in predictions[1:len(ids) - 1]]
+            for (predictions, _), ids in zip(outputs, encodings)]
+
+
+def evaluate_student(teacher, student_tagger, sentences):
+    """seqeval scores of the student against the teacher's labels on held-out sentences"""
+    encodings = teacher.tokenize(sentences)["input_ids"]
+    reference = label_sequences(teacher, teacher.predict_sentences(sentences, encodings), encodings)
+    predicted = label_sequences(teacher, student_tagger.predict_sentences(sentences, encodings), encodings)
+    print(classification_report(reference, predicted, digits=4))
+    return f1_score(reference, predicted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_reference_arguments(parser, held_out=True)
+    parser.add_argument("--output-path", default="student-model.bin")
+    parser.add_argument("--student-layers", type=int, default=6)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    args = parser.parse_args()
+
+    train_sentences, held_out = split_held_out(reference_sentences(args.input_csv, args.input_directory),
+                                               args.held_out, args.seed)
+    print(f"{len(train_sentences)} training / {len(held_out)} held-out sentences")
+
+    teacher = IOTagger(model_path=args.model_path)
+    if not isinstance(teacher.model, RoBERTaTokenClassifier):
+        raise ValueError("Distillation needs the torch backend for the teacher")
+    examples = teacher_targets(teacher, train_sentences)
+
+    student = build_student(teacher.model, args.student_layers)
+    train_student(student, examples, teacher.tokenizer.pad_token_id, args.epochs, args.batch_size,
+                  args.learning_rate, args.temperature, args.alpha)
+
+    save_checkpoint(student, teacher.tokenizer, args.output_path)
+    print(f"✅ Student saved to '{args.output_path}'")
+
+    if held_out:
+        student_tagger = IOTagger(model_path=args.output_path)
+        f1 = evaluate_student(teacher, student_tagger, held_out)
+        print(f"Held-out seqeval F1 against V1 labels: {f1:.4f}")
+
+
+if __name__ == "__main__":
+    main()
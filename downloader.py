@@ -0,0 +1,188 @@
+"""Resumable, checksummed model download with parallel byte ranges.
+
+    from downloader import download
+    download(MODEL_URL, "V1-model.bin", sha256="<expected hex digest>")
+
+The file is fetched into <path>.part in fixed-size ranges by a thread pool; finished ranges
+are recorded in <path>.part.json so an interrupted download resumes where it stopped.
+Once complete, the SHA-256 is checked (when given) and the file is moved into place with
+os.replace, so `path` only ever exists complete. An exclusive lock on <path>.lock makes
+concurrent processes (e.g. several Streamlit sessions) wait for one download instead of
+starting their own. Servers without range support fall back to a single stream.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from tqdm import tqdm
+
+from prediction_cache import file_sha256
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock
+    fcntl = None
+
+# Byte ranges must be of the stored file, not of a transfer-encoded copy
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+def pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view, offset = view[written:], offset + written
+
+
+# Windows has no pwrite: the range threads seek and write under one lock instead
+seek_lock = threading.Lock()
+
+
+def seek_write_all(fd, data, offset):
+    with seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+write_at = pwrite_all if hasattr(os, "pwrite") else seek_write_all
+
+
+def remote_size(url, timeout=30):
+    """(size in bytes or None, whether byte ranges are served) of the file behind `url`"""
+    response = requests.head(url, allow_redirects=True, headers=IDENTITY, timeout=timeout)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return int(size) if size is not None else None, ranges and size is not None
+
+
+def load_state(state_path, url, size):
+    """Completed range starts from an earlier attempt at the same download"""
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if state.get("url") != url or state.get("size") != size:
+        return set()
+    return set(state.get("done", []))
+
+
+def save_state(state_path, url, size, done):
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"url": url, "size": size, "done": sorted(done)}, f)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def fetch_range(url, fd, start, end, bar, timeout=30, retries=3, chunk_size=1 << 20):
+    """Write bytes [start, end] of `url` into fd at the same offset, retrying on network errors"""
+    for attempt in range(retries + 1):
+        position = start
+        try:
+            headers = {**IDENTITY, "Range": f"bytes={start}-{end}"}
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code != 206:
+                    raise DownloadError(f"Expected 206 for range {start}-{end}, got {response.status_code}")
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    write_at(fd, chunk, position)
+                    position += len(chunk)
+                    bar.update(len(chunk))
+            if position != end + 1:
+                raise DownloadError(f"Range {start}-{end} ended at byte {position}")
+            return start
+        except (requests.RequestException, DownloadError):
+            bar.update(start - position)
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def download_ranges(url, part_path, size, workers, part_size, timeout, retries, progress):
+    """Fetch the missing ranges of `url` into part_path"""
+    state_path = part_path + ".json"
+    done = load_state(state_path, url, size)
+    if not done or not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        done = set()
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+    starts = range(0, size, part_size)
+    todo = [start for start in starts if start not in done]
+    already = sum(min(part_size, size - start) for start in done)
+    # O_BINARY keeps Windows from translating newlines in the payload
+    fd = os.open(part_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        with tqdm(total=size, initial=already, unit="B", unit_scale=True) as bar, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            # Every range requests the published URL, so each GET follows the redirect afresh; signed
+            # release-asset URLs expire within minutes, long before a slow download finishes
+            futures = [pool.submit(fetch_range, url, fd, start, min(start + part_size, size) - 1, bar,
+                                   timeout, retries) for start in todo]
+            # Ranges are recorded as they finish, so an interruption loses at most the ones in flight
+            for future in as_completed(futures):
+                done.add(future.result())
+                save_state(state_path, url, size, done)
+                if progress is not None:
+                    progress(bar.n, size)
+    finally:
+        os.close(fd)
+
+
+def download_stream(url, part_path, timeout, progress):
+    """Single GET for servers without range support; restarts from zero"""
+    with requests.get(url, headers=IDENTITY, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        size = int(response.headers.get("Content-Length", 0)) or None
+        with open(part_path, "wb") as f, tqdm(total=size, unit="B", unit_scale=True) as bar:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+                bar.update(len(chunk))
+                if progress is not None:
+                    progress(bar.n, size)
+    if size is not None and os.path.getsize(part_path) != size:
+        raise DownloadError(f"Got {os.path.getsize(part_path)} of {size} bytes")
+
+
+def download(url, path, sha256=None, workers=4, part_size=16 << 20, timeout=30, retries=3, progress=None):
+    """Download `url` to `path` unless it already exists; returns `path`.
+
+    `progress(done_bytes, total_bytes)` is called as ranges complete. Raises DownloadError
+    when the transfer or the SHA-256 check fails; a bad file is discarded, not kept.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    part_path = path + ".part"
+    with open(path + ".lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Another process may have finished while this one waited for the lock
+        if os.path.exists(path):
+            return path
+
+        if sha256 is None:
+            print(f"⚠️ No SHA-256 given for {url}; the download will not be verified")
+        size, ranges = remote_size(url, timeout)
+        if ranges:
+            download_ranges(url, part_path, size, workers, part_size, timeout, retries, progress)
+        else:
+            download_stream(url, part_path, timeout, progress)
+
+        if sha256 is not None:
+            actual = file_sha256(part_path)
+            if actual != sha256.lower():
+                os.remove(part_path)
+                if os.path.exists(part_path + ".json"):
+                    os.remove(part_path + ".json")
+                raise DownloadError(f"SHA-256 mismatch for {url}: expected {sha256}, got {actual}")
+        os.replace(part_path, path)
+        if os.path.exists(part_path + ".json"):
+            os.remove(part_path + ".json")
+    return path
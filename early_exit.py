@@ -0,0 +1,102 @@
+"""Train early-exit heads for the V1 tagger by self-distillation from its final head.
+
+    python early_exit.py --depths 6 12 18 --thresholds 0.9 0.95 0.99
+    python -c "from predict import IOTagger; IOTagger(exit_threshold=0.95)"
+
+The encoder and the final classifier stay frozen; one linear head per depth learns to
+match the final head's temperature-softened distribution. The heads are saved next to
+the weights (V1-model-exits.bin). With IOTagger(exit_threshold=t) a batch stops at the
+first head where every token's confidence reaches t. Held-out rows report agreement
+with the full model, throughput and the average depth used per sentence.
+"""
+import argparse
+import random
+import time
+
+import torch
+import torch.nn.functional as F
+
+from evaluate_backends import add_reference_arguments, label_agreement, reference_sentences, split_held_out
+from predict import IOTagger, RoBERTaTokenClassifier, exit_heads_path, pad_ids
+
+
+def train_exit_heads(model, encodings, pad_id, depths, epochs=3, batch_size=16, learning_rate=1e-3,
+                     temperature=2.0):
+    """Fit one head per depth to the frozen final head's soft labels"""
+    model.add_exit_heads(depths)
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    for parameter in model.exit_heads.parameters():
+        parameter.requires_grad_(True)
+    optimizer = torch.optim.AdamW(model.exit_heads.parameters(), lr=learning_rate)
+    # Keep dropout off in the frozen backbone
+    model.eval()
+
+    for epoch in range(epochs):
+        random.shuffle(encodings)
+        total = 0.0
+        for i in range(0, len(encodings), batch_size):
+            input_ids, attention_mask = pad_ids(encodings[i:i + batch_size], pad_id)
+            mask = attention_mask.bool()
+            with torch.no_grad():
+                hidden_states = model.roberta(input_ids=input_ids, attention_mask=attention_mask,
+                                              output_hidden_states=True).hidden_states
+                targets = F.softmax(model.classifier(hidden_states[-1])[mask] / temperature, dim=-1)
+
+            loss = 0.0
+            for depth in depths:
+                logits = model.exit_heads[str(depth)](hidden_states[depth])[mask]
+                loss = loss + F.kl_div(F.log_softmax(logits / temperature, dim=-1), targets,
+                                       reduction="batchmean") * temperature ** 2
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item()
+        print(f"epoch {epoch + 1}/{epochs}: loss {total / max(1, -(-len(encodings) // batch_size)):.4f}")
+    return model.exit_heads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_reference_arguments(parser, held_out=True)
+    parser.add_argument("--depths", type=int, nargs="+", default=[6, 12, 18])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.9, 0.95, 0.99])
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    train_sentences, held_out = split_held_out(reference_sentences(args.input_csv, args.input_directory),
+                                               args.held_out, args.seed)
+
+    tagger = IOTagger(model_path=args.model_path)
+    if not isinstance(tagger.model, RoBERTaTokenClassifier):
+        raise ValueError("Early-exit training needs the torch backend")
+    model = tagger.model.cpu()
+    encodings = tagger.tokenize(train_sentences)["input_ids"]
+    exit_heads = train_exit_heads(model, encodings, tagger.tokenizer.pad_token_id, args.depths,
+                                  args.epochs, args.batch_size, args.learning_rate)
+    torch.save(exit_heads.state_dict(), exit_heads_path(args.model_path))
+    print(f"✅ Early-exit heads saved to '{exit_heads_path(args.model_path)}'")
+
+    if not held_out:
+        return
+    reference = IOTagger(model_path=args.model_path)
+    start = time.perf_counter()
+    reference_outputs = reference.predict_sentences(held_out)
+    reference_time = time.perf_counter() - start
+    layers = reference.model.roberta.config.num_hidden_layers
+    print(f"{'threshold':>9} {'sent/s':>8} {'avg depth':>9} {'agreement':>9}")
+    print(f"{'full':>9} {len(held_out) / reference_time:>8.2f} {layers:>9.2f} {1:>9.2%}")
+    for threshold in args.thresholds:
+        candidate = IOTagger(model_path=args.model_path, exit_threshold=threshold)
+        start = time.perf_counter()
+        outputs = candidate.predict_sentences(held_out)
+        seconds = time.perf_counter() - start
+        agreement = label_agreement(reference_outputs, outputs)["token_agreement"]
+        print(f"{threshold:>9} {len(held_out) / seconds:>8.2f} {candidate.average_exit_depth():>9.2f} "
+              f"{agreement:>9.2%}")
+
+
+if __name__ == "__main__":
+    main()
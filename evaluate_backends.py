@@ -0,0 +1,133 @@
+"""Label agreement of an IOTagger backend against the fp32 torch model.
+
+    python evaluate_backends.py --backend quantized
+    python evaluate_backends.py --backend quantized --input-csv output/output.csv
+    python evaluate_backends.py --cascade --backend quantized --threshold 0.9
+    python evaluate_backends.py --input-csv output/output.csv --tokenized-cache tokenized_cache
+
+With --cascade the candidate is the fp32 model behind a draft tagger (built from
+--backend and --draft-model-path) that only escalates its uncertain sentences.
+
+Without --input-csv the reference sentences come from running PreprocessText
+over test_data, i.e. the same rows the SourceTracker stage would produce.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+import torch
+
+from predict import IOTagger
+from tokenized_cache import tokenized_dataset, tokenized_rows
+from preprocessing import PreprocessText
+
+
+def reference_sentences(input_csv=None, input_directory="test_data", limit=None):
+    """ReportingSentence rows from a CSV, or from preprocessing the raw texts"""
+    if input_csv is None:
+        output_directory = tempfile.mkdtemp()
+        config = {
+            'context_range': 3,
+            'max_merge': 3,
+            'reporting_verbs_file': os.path.join(os.path.dirname(__file__), 'reporting_verbs.csv'),
+            'output_directory': output_directory,
+            'input_directory': input_directory,
+        }
+        PreprocessText(config).preprocess_text()
+        input_csv = os.path.join(output_directory, "output.csv")
+
+    sentences = [str(sentence) for sentence in pd.read_csv(input_csv)["ReportingSentence"]]
+    return sentences[:limit] if limit else sentences
+
+
+def add_reference_arguments(parser, held_out=False):
+    """--model-path and the reference sentence source; with held_out, also --held-out and --seed"""
+    parser.add_argument("--model-path", default="V1-model.bin")
+    parser.add_argument("--input-csv", default=None)
+    parser.add_argument("--input-directory", default="test_data")
+    if held_out:
+        parser.add_argument("--held-out", type=float, default=0.1)
+        parser.add_argument("--seed", type=int, default=42)
+
+
+def split_held_out(sentences, held_out, seed):
+    """Seed python and torch, then shuffle `sentences` into (training, held-out) lists"""
+    random.seed(seed)
+    torch.manual_seed(seed)
+    sentences = list(sentences)
+    random.shuffle(sentences)
+    split = int(len(sentences) * (1 - held_out))
+    return sentences[:split], sentences[split:]
+
+
+def timed_predict(tagger, sentences, encodings=None):
+    start = time.perf_counter()
+    outputs = tagger.predict_sentences(sentences, encodings)
+    return outputs, time.perf_counter() - start
+
+
+def label_agreement(reference, candidate):
+    """Token- and sentence-level agreement between two predict_sentences outputs"""
+    same_tokens = total_tokens = same_sentences = 0
+    for (reference_labels, _), (candidate_labels, _) in zip(reference, candidate):
+        matches = reference_labels == candidate_labels
+        same_tokens += int(matches.sum())
+        total_tokens += len(matches)
+        same_sentences += bool(matches.all())
+    return {
+        "token_agreement": same_tokens / max(total_tokens, 1),
+        "sentence_agreement": same_sentences / max(len(reference), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_reference_arguments(parser)
+    parser.add_argument("--backend", default="quantized")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--draft-model-path", default=None)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--tokenized-cache", default=None,
+                        help="directory of pre-tokenized datasets, reused across runs (needs --input-csv)")
+    args = parser.parse_args()
+
+    sentences = reference_sentences(args.input_csv, args.input_directory, args.limit)
+    print(f"Evaluating on {len(sentences)} reporting sentences")
+
+    reference = IOTagger(model_path=args.model_path, batch_size=args.batch_size)
+    encodings = None
+    if args.tokenized_cache and args.input_csv:
+        dataset = tokenized_dataset(reference, args.input_csv, args.tokenized_cache)
+        encodings = tokenized_rows(dataset, 0, len(sentences))["input_ids"]
+    reference_outputs, reference_time = timed_predict(reference, sentences, encodings)
+    del reference
+
+    if args.cascade:
+        draft = IOTagger(model_path=args.draft_model_path or args.model_path,
+                         batch_size=args.batch_size, backend=args.backend)
+        candidate = IOTagger(model_path=args.model_path, batch_size=args.batch_size,
+                             draft=draft, escalation_threshold=args.threshold)
+        name = "cascade"
+    else:
+        candidate = IOTagger(model_path=args.model_path, batch_size=args.batch_size, backend=args.backend)
+        name = args.backend
+    candidate_outputs, candidate_time = timed_predict(candidate, sentences, encodings)
+
+    agreement = label_agreement(reference_outputs, candidate_outputs)
+    print(f"fp32 torch : {len(sentences) / reference_time:8.2f} sentences/s")
+    print(f"{name:<11}: {len(sentences) / candidate_time:8.2f} sentences/s")
+    if args.cascade:
+        stats = candidate.cascade_stats
+        print(f"Escalation rate at threshold {args.threshold}: "
+              f"{stats['escalated'] / max(stats['sentences'], 1):.2%}")
+    print(f"Token label agreement   : {agreement['token_agreement']:.2%}")
+    print(f"Sentence exact agreement: {agreement['sentence_agreement']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,75 @@
+import json
 import os
-import re
+import shutil
+import threading
+import time
+import zipfile
 import torch
-import requests
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import torch.nn as nn
-from transformers import RobertaModel, RobertaTokenizerFast
+from transformers import RobertaConfig, RobertaModel, RobertaTokenizerFast
+from transformers.modeling_utils import no_init_weights
+from downloader import DownloadError, download
+from prediction_cache import PredictionCache, model_checksum
+
+# v1.0 release asset and its published SHA-256; downloads are verified before being moved into place.
+# The digest must be copied from the release (sha256sum of the published V1-model.bin) - until it
+# is filled in, download_model refuses to fetch MODEL_URL rather than install it unverified.
+MODEL_URL = "https://github.com/PseudoInsider/autoRecognition/releases/download/v1.0/V1-model.bin"
+MODEL_SHA256 = None
+
+SPAN_CATEGORIES = ("cue", "source", "content", "hinge", "residue")
+RESULT_COLUMNS = ["No.", "TextID", "Context", "ReportingSentence", "tagged_sentences", *SPAN_CATEGORIES]
+# Code points treated as whitespace when deciding whether a token carries any text
+WHITESPACE_CODEPOINTS = np.array([0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x20, 0x85, 0xA0, 0x2028, 0x2029, 0x3000],
+                                 dtype=np.uint32)
 
 
 class RoBERTaTokenClassifier(nn.Module):
-    def __init__(self, model_name="roberta-large", num_labels=6):
+    def __init__(self, model_name="roberta-large", num_labels=6, config=None):
         super().__init__()
-        self.roberta = RobertaModel.from_pretrained(model_name)
+        if config is not None:
+            # Architecture only: the fine-tuned state_dict supplies every weight
+            self.roberta = RobertaModel(config)
+        else:
+            self.roberta = RobertaModel.from_pretrained(model_name)
         self.classifier = nn.Linear(self.roberta.config.hidden_size, num_labels)
         self.dropout = nn.Dropout(0.1)
+        # Optional early-exit heads keyed by encoder depth (see add_exit_heads)
+        self.exit_heads = nn.ModuleDict()
+        self.exit_threshold = None
+        self.last_exit_depth = None
+
+    def add_exit_heads(self, depths):
+        """Attach classifier heads after the given numbers of encoder layers"""
+        for depth in depths:
+            self.exit_heads[str(depth)] = nn.Linear(self.roberta.config.hidden_size, self.classifier.out_features)
+
+    def forward_early_exit(self, input_ids, attention_mask, position_ids=None):
+        """Run layer by layer and stop at the first exit head where every token clears exit_threshold"""
+        hidden = self.roberta.embeddings(input_ids=input_ids, position_ids=position_ids)
+        extended_mask = self.roberta.get_extended_attention_mask(attention_mask, input_ids.shape)
+        # Padding rows of a packed (3-D) mask attend to nothing
+        token_mask = attention_mask.bool() if attention_mask.dim() == 2 else attention_mask.any(dim=-1)
+        layers = self.roberta.encoder.layer
+        for depth, layer in enumerate(layers, start=1):
+            hidden = layer(hidden, attention_mask=extended_mask)[0]
+            head = self.exit_heads[str(depth)] if str(depth) in self.exit_heads else None
+            if head is not None and depth < len(layers):
+                logits = head(hidden)
+                confidence = logits.softmax(dim=-1).max(dim=-1).values
+                if bool((confidence[token_mask] >= self.exit_threshold).all()):
+                    self.last_exit_depth = depth
+                    return logits
+        self.last_exit_depth = len(layers)
+        return self.classifier(hidden)
 
-    def forward(self, input_ids, attention_mask, labels=None):
-        outputs = self.roberta(input_ids=input_ids, attention_mask=attention_mask)
+    def forward(self, input_ids, attention_mask, labels=None, position_ids=None):
+        if labels is None and not self.training and self.exit_threshold is not None and len(self.exit_heads):
+            return self.forward_early_exit(input_ids, attention_mask, position_ids)
+        outputs = self.roberta(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids)
         sequence_output = outputs.last_hidden_state
         logits = self.classifier(self.dropout(sequence_output))
         if labels is not None:
@@ -26,31 +79,343 @@ class RoBERTaTokenClassifier(nn.Module):
         return logits
 
 
+def model_config_path(model_path):
+    """Bundled architecture config, e.g. V1-model.bin -> V1-model-config.json"""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}-config.json"
+
+
+def model_tokenizer_path(model_path):
+    """Directory of tokenizer files vendored next to the model, e.g. V1-model-tokenizer/"""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}-tokenizer"
+
+
+def vendor_tokenizer(model_path="V1-model.bin", tokenizer_name="roberta-large"):
+    """One-time copy of the tokenizer files next to the model so later starts need no network"""
+    tokenizer_path = model_tokenizer_path(model_path)
+    # Saved beside the final directory, then renamed, so concurrent starts never load a partial copy
+    tmp_path = f"{tokenizer_path}.tmp-{os.getpid()}"
+    RobertaTokenizerFast.from_pretrained(tokenizer_name).save_pretrained(tmp_path)
+    try:
+        os.replace(tmp_path, tokenizer_path)
+    except OSError:
+        # Another process vendored it first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def model_installed(model_path="V1-model.bin"):
+    """Weights and vendored tokenizer are both present, so IOTagger starts without network"""
+    return os.path.exists(model_path) and os.path.isdir(model_tokenizer_path(model_path))
+
+
+def download_model(model_path="V1-model.bin", model_url=MODEL_URL, sha256=None, tokenizer_name="roberta-large",
+                   progress=None):
+    """Fetch whatever of the weights and tokenizer is missing.
+
+    MODEL_URL is only accepted with its published digest (MODEL_SHA256 or `sha256`).
+    """
+    if not os.path.exists(model_path):
+        if sha256 is None and model_url == MODEL_URL:
+            sha256 = MODEL_SHA256
+        if sha256 is None and model_url == MODEL_URL:
+            raise DownloadError(f"No published SHA-256 for {model_url}: set predict.MODEL_SHA256 "
+                                f"(or pass the digest) before downloading it")
+        print(f"Downloading model from {model_url} ...")
+        # Parallel ranges, resumable, verified and moved into place atomically
+        download(model_url, model_path, sha256=sha256, progress=progress)
+        print("✅ Model downloaded successfully!")
+    if not os.path.isdir(model_tokenizer_path(model_path)):
+        vendor_tokenizer(model_path, tokenizer_name)
+        print(f"✅ Tokenizer saved to '{model_tokenizer_path(model_path)}'")
+    return model_path
+
+
+def save_checkpoint(model, tokenizer, model_path):
+    """Weights, config and tokenizer side by side, so IOTagger(model_path=...) rebuilds it offline"""
+    torch.save(model.state_dict(), model_path)
+    model.roberta.config.to_json_file(model_config_path(model_path))
+    tokenizer.save_pretrained(model_tokenizer_path(model_path))
+
+
+def pad_ids(batch_ids, pad_id):
+    """Right-pad rows of token ids into (input_ids, attention_mask) tensors"""
+    max_len = max(len(ids) for ids in batch_ids)
+    input_ids = torch.full((len(batch_ids), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_ids), max_len), dtype=torch.long)
+    for row, ids in enumerate(batch_ids):
+        input_ids[row, :len(ids)] = torch.as_tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def load_weights(model_path, map_location="cpu"):
+    """torch.load a state_dict, memory-mapped where the checkpoint format allows it"""
+    try:
+        return torch.load(model_path, map_location=map_location, mmap=True, weights_only=True)
+    except RuntimeError:
+        # Legacy (pre zip-file) checkpoints cannot be memory-mapped
+        return torch.load(model_path, map_location=map_location)
+
+
+def exit_heads_path(model_path):
+    """Trained early-exit heads, e.g. V1-model.bin -> V1-model-exits.bin"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}-exits{ext}"
+
+
+def mmap_model_path(model_path):
+    """Zip-format copy of a legacy checkpoint, e.g. V1-model.bin -> V1-model-mmap.bin"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}-mmap{ext}"
+
+
+def ensure_mmap_checkpoint(model_path):
+    """Path of a checkpoint torch can memory-map, re-saving a legacy one in zip format once"""
+    if zipfile.is_zipfile(model_path):
+        return model_path
+    mmap_path = mmap_model_path(model_path)
+    if not os.path.exists(mmap_path) or os.path.getmtime(mmap_path) < os.path.getmtime(model_path):
+        torch.save(torch.load(model_path, map_location="cpu"), mmap_path + ".tmp")
+        os.replace(mmap_path + ".tmp", mmap_path)
+    return mmap_path
+
+
+def quantized_model_path(model_path):
+    """Location of the cached int8 state_dict, e.g. V1-model.bin -> V1-model-int8.bin"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}-int8{ext}"
+
+
+def quantize_model(model):
+    """Int8 dynamic quantization of every Linear layer (encoder and classifier head)"""
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_model_path(model_path):
+    """Location of the exported ONNX graph, e.g. V1-model.bin -> V1-model.onnx"""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.onnx"
+
+
+def export_onnx(model, onnx_path, opset_version=17):
+    """One-time export of the tagger with dynamic batch and sequence axes"""
+    model = model.cpu().eval()
+    dummy_ids = torch.ones((2, 8), dtype=torch.long)
+    dummy_mask = torch.ones((2, 8), dtype=torch.long)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy_ids, dummy_mask),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset_version,
+        )
+
+
+class OnnxTokenClassifier:
+    """onnxruntime CPU session exposing the same call signature as RoBERTaTokenClassifier"""
+
+    def __init__(self, onnx_path, num_threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime pick one thread per physical core
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask, position_ids=None):
+        if position_ids is not None or attention_mask.dim() != 2:
+            raise ValueError("The ONNX graph only takes 2-D attention masks without position ids")
+        logits = self.session.run(["logits"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+        })[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+class TracedTokenClassifier:
+    """TorchScript traces of a RoBERTaTokenClassifier, one per bucketed sequence length.
+
+    Each trace takes a fixed (batch_size, length) shape, so batches are padded up to the
+    nearest compiled length and to batch_size rows. Anything else (longer sequences, packed
+    3-D masks, position ids) runs through the eager model.
+    """
+
+    def __init__(self, model, lengths, batch_size, pad_id):
+        self.model = model
+        self.batch_size = batch_size
+        self.pad_id = pad_id
+        self.device = next(model.parameters()).device
+        self.traces = {}
+        self.stats = {"compiled": 0, "eager": 0}
+        for length in sorted(set(lengths)):
+            input_ids = torch.full((batch_size, length), pad_id, dtype=torch.long, device=self.device)
+            attention_mask = torch.ones((batch_size, length), dtype=torch.long, device=self.device)
+            try:
+                with torch.no_grad():
+                    traced = torch.jit.freeze(torch.jit.trace(model, (input_ids, attention_mask)))
+                    # The profiling executor specialises the graph over the first calls
+                    for _ in range(2):
+                        traced(input_ids, attention_mask)
+            except Exception as exc:
+                print(f"⚠️ Could not trace length {length}, using eager mode for it: {exc}")
+                continue
+            self.traces[length] = traced
+
+    def __call__(self, input_ids, attention_mask, position_ids=None):
+        rows, seq_len = input_ids.shape
+        length = min((l for l in self.traces if l >= seq_len), default=None)
+        if position_ids is not None or attention_mask.dim() != 2 or rows > self.batch_size or length is None:
+            self.stats["eager"] += 1
+            return self.model(input_ids, attention_mask, position_ids=position_ids)
+
+        padded_ids = torch.full((self.batch_size, length), self.pad_id, dtype=torch.long, device=self.device)
+        padded_mask = torch.zeros((self.batch_size, length), dtype=torch.long, device=self.device)
+        padded_ids[:rows, :seq_len] = input_ids
+        padded_mask[:rows, :seq_len] = attention_mask
+        # Filler rows attend to one token so their softmax stays finite
+        padded_mask[rows:, 0] = 1
+        self.stats["compiled"] += 1
+        return self.traces[length](padded_ids, padded_mask)[:rows, :seq_len]
+
+    def eval(self):
+        return self
+
+
+def append_rows(rows, output_path, writer=None, first=True):
+    """Append result rows to a CSV, or to a Parquet file when output_path ends in .parquet"""
+    columns = RESULT_COLUMNS + [column for column in (rows[0] if rows else {}) if column not in RESULT_COLUMNS]
+    df = pd.DataFrame(rows, columns=columns)
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    else:
+        df.to_csv(output_path, mode="w" if first else "a", header=first, index=False, encoding="utf-8")
+    return writer
+
+
+def token_confidence(scores):
+    """Per-token max probability from either predict_sentences output form"""
+    return scores.max(axis=-1) if scores.ndim == 2 else scores
+
+
+def count_rows(input_csv, chunk_size=100_000):
+    """Data rows in a CSV, parsed (not line-counted) so quoted newlines are handled"""
+    with pd.read_csv(input_csv, usecols=[0], chunksize=chunk_size) as reader:
+        return sum(len(chunk) for chunk in reader)
+
+
+def write_rows(rows, output_path, chunk_size=1000):
+    """Pass rows through while appending them to output_path every chunk_size rows.
+
+    Rows already flushed stay on disk if the run dies part-way through.
+    """
+    writer = None
+    first = True
+    buffer = []
+    try:
+        for row in rows:
+            buffer.append(row)
+            yield row
+            if len(buffer) >= chunk_size:
+                writer = append_rows(buffer, output_path, writer, first)
+                first, buffer = False, []
+        if buffer or first:
+            writer = append_rows(buffer, output_path, writer, first)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
 class IOTagger:
     def __init__(self, model_path="V1-model.bin", num_labels=6,
-                 tokenizer_name="roberta-large", model_url=None):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                 tokenizer_name="roberta-large", model_url=None,
+                 batch_size=16, max_length=512, packing=False, stride=None,
+                 backend="torch", config_path=None, shared_weights=False, cache=None,
+                 draft=None, escalation_threshold=0.9, exit_threshold=None, compile_lengths=None,
+                 tokenized_cache=None, model_sha256=None, span_confidence=False, debug_probabilities=False):
+        if backend not in ("torch", "quantized", "onnx"):
+            raise ValueError(f"Unknown backend '{backend}', expected 'torch', 'quantized' or 'onnx'")
+        if backend == "onnx" and packing:
+            raise ValueError("Sequence packing needs the torch or quantized backend")
+        if exit_threshold is not None and backend != "torch":
+            raise ValueError("Early exit needs the torch backend")
+        if compile_lengths and (backend != "torch" or exit_threshold is not None):
+            raise ValueError("compile_lengths traces the eager torch model and excludes early exit")
+        if shared_weights and backend != "torch":
+            raise ValueError("shared_weights maps the fp32 checkpoint and needs the torch backend")
+        # Dynamically quantized kernels, the ONNX CPU provider and mmap'd weights only run on CPU
+        use_cuda = torch.cuda.is_available() and backend == "torch" and not shared_weights
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+        self.backend = backend
+        # Weights stay in read-only file-backed pages that every worker process maps the same copy of
+        self.shared_weights = shared_weights
+        # Cascade: a cheaper IOTagger sharing this tokenizer (e.g. the int8 backend or a student)
+        # tags every sentence first; only uncertain ones are escalated to this model
+        self.draft = draft
+        self.escalation_threshold = escalation_threshold
+        self.cascade_stats = {"sentences": 0, "escalated": 0}
+        self.model_path = model_path
+        # Serialises inference when one instance is shared between threads (e.g. Streamlit sessions)
+        self.lock = threading.RLock()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.packing = packing
+        # Overlap (in tokens) between sliding windows; None truncates at max_length
+        if stride is not None and not 0 <= stride < max_length - 2:
+            raise ValueError(f"stride must be in [0, {max_length - 2}), got {stride}")
+        self.stride = stride
+        # Without a bundled config the encoder falls back to RobertaModel.from_pretrained
+        if config_path is None and os.path.exists(model_config_path(model_path)):
+            config_path = model_config_path(model_path)
+        self.config_path = config_path
 
         # -------- 下载 GitHub Release 模型 --------
-        if not os.path.exists(model_path) and model_url:
-            print(f"Downloading model from {model_url} ...")
-            r = requests.get(model_url, stream=True)
-            total_length = int(r.headers.get('content-length', 0))
-            with open(model_path, "wb") as f:
-                for chunk in tqdm(r.iter_content(chunk_size=8192),
-                                  total=total_length // 8192,
-                                  unit='KB'):
-                    if chunk:
-                        f.write(chunk)
-            print("✅ Model downloaded successfully!")
+        # Downloads the weights and vendors the tokenizer next to them, so later starts need no network
+        if model_url:
+            download_model(model_path, model_url, model_sha256, tokenizer_name)
 
         # -------- 初始化模型并加载权重 --------
-        self.model = RoBERTaTokenClassifier(num_labels=num_labels).to(self.device)
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+        if backend == "quantized":
+            self.model = self.load_quantized(model_path, num_labels)
+        elif backend == "onnx":
+            self.model = self.load_onnx(model_path, num_labels)
+        else:
+            self.model = self.build_model(model_path, num_labels)
+            if exit_threshold is not None:
+                self.load_exit_heads(model_path, exit_threshold)
+            self.model.to(self.device)
         self.model.eval()
+        # Encoder layers actually run, summed over segments, when early exit is enabled
+        self.exit_stats = {"segments": 0, "layers": 0}
 
         # -------- 初始化分词器 --------
-        self.tokenizer = RobertaTokenizerFast.from_pretrained(tokenizer_name)
+        if os.path.isdir(model_tokenizer_path(model_path)):
+            self.tokenizer = RobertaTokenizerFast.from_pretrained(model_tokenizer_path(model_path))
+        else:
+            self.tokenizer = RobertaTokenizerFast.from_pretrained(tokenizer_name)
+
+        # -------- 编译固定长度图 --------
+        # e.g. compile_lengths=(32, 64, 128, 256, 512): traced and warmed here, eager for other shapes
+        if compile_lengths:
+            self.model = TracedTokenClassifier(self.model, [min(l, max_length) for l in compile_lengths],
+                                               batch_size, self.tokenizer.pad_token_id)
 
         self.label_to_id = {
             "O": 0, "I-source": 1, "I-residue": 2,
@@ -62,148 +427,435 @@ class IOTagger:
             "I-residue": "residue", "I-content": "content", "O": "O"
         }
 
+        # -------- 预测缓存 --------
+        # `cache` is a PredictionCache or the path of its SQLite file
+        if isinstance(cache, str):
+            cache = PredictionCache(cache)
+        self.cache = cache
+        # Directory of pre-tokenized Arrow datasets reused by predict_stream (see tokenized_cache.py)
+        self.tokenized_cache = tokenized_cache
+        # Extra output columns: mean confidence per span, and (debug) every token's full distribution
+        self.span_confidence = span_confidence
+        self.debug_probabilities = debug_probabilities
+        if cache is not None:
+            # Everything that changes the decoded spans: weights, numeric backend and truncation
+            self.cache_namespace = f"{model_checksum(model_path)}:{backend}:{max_length}:{stride}"
+            if exit_threshold is not None:
+                self.cache_namespace += f":exit:{model_checksum(exit_heads_path(model_path))}:{exit_threshold}"
+            if span_confidence or debug_probabilities:
+                self.cache_namespace += f":columns:{span_confidence}:{debug_probabilities}"
+            if draft is not None:
+                self.cache_namespace += (f":cascade:{model_checksum(draft.model_path)}:{draft.backend}"
+                                         f":{escalation_threshold}")
+        self.categories = np.array(
+            [self.label_mapping.get(self.id2label.get(i), "O") for i in range(num_labels)], dtype=object)
+
+    def load_exit_heads(self, model_path, exit_threshold):
+        path = exit_heads_path(model_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No early-exit heads at '{path}'; train them with early_exit.py")
+        state_dict = torch.load(path, map_location="cpu", weights_only=True)
+        self.model.add_exit_heads(sorted({int(key.split(".")[0]) for key in state_dict}))
+        self.model.exit_heads.load_state_dict(state_dict)
+        self.model.exit_threshold = exit_threshold
+
+    def record_exit_depth(self, segments):
+        depth = getattr(self.model, "last_exit_depth", None)
+        if depth is not None:
+            self.exit_stats["segments"] += segments
+            self.exit_stats["layers"] += depth * segments
+
+    def average_exit_depth(self):
+        """Mean number of encoder layers run per segment (a sentence or one of its windows)"""
+        return self.exit_stats["layers"] / max(self.exit_stats["segments"], 1)
+
+    def build_model(self, model_path, num_labels, with_weights=True):
+        """Build the tagger on CPU and load the fine-tuned weights into it once"""
+        if self.shared_weights and self.config_path is None:
+            raise ValueError("shared_weights needs a model config (e.g. V1-model-config.json)")
+        if self.config_path is None:
+            model = RoBERTaTokenClassifier(num_labels=num_labels)
+            if with_weights:
+                model.load_state_dict(torch.load(model_path, map_location="cpu"))
+            return model
+
+        # from_pretrained (unlike from_json_file) restores integer keys in pruned_heads
+        config = RobertaConfig.from_pretrained(self.config_path)
+        with no_init_weights():
+            model = RoBERTaTokenClassifier(num_labels=num_labels, config=config)
+        if with_weights and self.shared_weights:
+            # assign=True keeps the mmap'd tensors instead of copying them into private memory
+            model.load_state_dict(load_weights(ensure_mmap_checkpoint(model_path)), assign=True)
+        elif with_weights:
+            model.load_state_dict(load_weights(model_path), assign=True)
+        else:
+            # Skipped initialisation leaves garbage (even NaN) that would break quantization observers
+            with torch.no_grad():
+                for tensor in model.state_dict().values():
+                    tensor.zero_()
+        return model
+
+    def load_quantized(self, model_path, num_labels):
+        """Load the int8 model, converting and caching it next to the fp32 weights on first use"""
+        cache_path = quantized_model_path(model_path)
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(model_path):
+            model = quantize_model(self.build_model(model_path, num_labels, with_weights=False).eval())
+            model.load_state_dict(torch.load(cache_path, map_location="cpu"))
+            return model
 
-    def process_token_results(self, token_results):
-        words = [token['word'] for token in token_results if token['word'].strip()]
-        pred_labels = [token['pred_label'] for token in token_results if token['word'].strip()]
+        print(f"Quantizing {model_path} to int8 ...")
+        model = quantize_model(self.build_model(model_path, num_labels).eval())
+        # Written aside and renamed, so a crash or a concurrent reader never sees a truncated cache
+        torch.save(model.state_dict(), cache_path + ".tmp")
+        os.replace(cache_path + ".tmp", cache_path)
+        print(f"✅ Quantized weights cached at '{cache_path}'")
+        return model
 
-        special_tokens = {"<s>", "</s>", ""}
-        processed_words = [word for word in words if word not in special_tokens]
-        filtered_labels = [label for word, label in zip(words, pred_labels) if word not in special_tokens]
+    def load_onnx(self, model_path, num_labels):
+        """Open the ONNX graph for onnxruntime, exporting it from the torch weights on first use"""
+        onnx_path = onnx_model_path(model_path)
+        if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path):
+            print(f"Exporting {model_path} to ONNX ...")
+            model = self.build_model(model_path, num_labels)
+            export_onnx(model, onnx_path + ".tmp")
+            os.replace(onnx_path + ".tmp", onnx_path)
+            del model
+            print(f"✅ ONNX graph saved at '{onnx_path}'")
+        # Same intra-op thread budget as torch.set_num_threads gives the other backends
+        return OnnxTokenClassifier(onnx_path, torch.get_num_threads())
 
-        # Reconstruct sentence
-        clean_sentence_parts = []
-        i = 0
-        while i < len(processed_words):
-            token = processed_words[i]
-            if token.startswith("##"):
-                clean_sentence_parts[-1] += token[2:]
+    def length_buckets(self, lengths):
+        """Group row indices into batches of similar token length"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+    def reduce_logits(self, logits, spans, keep_logits=None):
+        """Per-span outputs for (row, start, end) slices of a batch's logits.
+
+        Softmax, argmax and max-probability run on the model's device, so only uint8 labels
+        and float32 confidences are copied to the host. Spans flagged in `keep_logits`
+        (window merging, full probabilities) get their raw logits instead.
+        """
+        confidence, labels = torch.softmax(logits.float(), dim=-1).max(dim=-1)
+        labels, confidence = labels.to(torch.uint8).cpu(), confidence.cpu()
+        keep_logits = keep_logits or [False] * len(spans)
+        host_logits = logits.cpu() if any(keep_logits) else None
+        return [host_logits[row, start:end] if keep else (labels[row, start:end], confidence[row, start:end])
+                for (row, start, end), keep in zip(spans, keep_logits)]
+
+    def forward_batch(self, batch_ids, keep_logits=None):
+        """Pad a batch to its own longest row and return per-row outputs (see reduce_logits)"""
+        input_ids, attention_mask = pad_ids(batch_ids, self.tokenizer.pad_token_id)
+
+        with torch.no_grad():
+            logits = self.model(input_ids.to(self.device), attention_mask=attention_mask.to(self.device))
+            outputs = self.reduce_logits(logits, [(row, 0, len(ids)) for row, ids in enumerate(batch_ids)],
+                                         keep_logits)
+        self.record_exit_depth(len(batch_ids))
+        return outputs
+
+    def pack_rows(self, lengths):
+        """Best-fit packing of row indices into sequences of at most max_length tokens"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        packs = []
+        packs_by_space = {}
+        for i in order:
+            length = lengths[i]
+            for space in range(length, self.max_length + 1):
+                if packs_by_space.get(space):
+                    pack_id = packs_by_space[space].pop()
+                    break
             else:
-                if clean_sentence_parts:
-                    clean_sentence_parts.append(" ")
-                clean_sentence_parts.append(token)
-            i += 1
-        clean_sentence = "".join(clean_sentence_parts)
+                pack_id = len(packs)
+                packs.append([])
+                space = self.max_length
+            packs[pack_id].append(i)
+            packs_by_space.setdefault(space - length, []).append(pack_id)
+        return packs
 
-        categories = [self.label_mapping.get(label, "O") for label in filtered_labels]
+    def packed_batches(self, lengths):
+        """Group packed sequences into batches of batch_size sequences"""
+        packs = self.pack_rows(lengths)
+        return [packs[i:i + self.batch_size] for i in range(0, len(packs), self.batch_size)]
 
-        tagged_sentence_parts = []
-        current_label = None
-        for word, category in zip(processed_words, categories):
-            if category == "O":
-                if current_label is not None:
-                    tagged_sentence_parts.append(f"</{current_label}>")
-                    current_label = None
-                if word.startswith("##"):
-                    tagged_sentence_parts[-1] += word[2:]
-                else:
-                    if tagged_sentence_parts:
-                        tagged_sentence_parts.append(" ")
-                    tagged_sentence_parts.append(word)
+    def forward_packed(self, packed_ids, keep_logits=None):
+        """Run packed sequences with block-diagonal attention and per-segment position ids.
+
+        `packed_ids` is a list of sequences, each a list of per-row token id lists.
+        Returns per-row outputs (see reduce_logits) in the order the rows were packed.
+        """
+        pad_id = self.tokenizer.pad_token_id
+        max_len = max(sum(len(ids) for ids in segments) for segments in packed_ids)
+        input_ids = torch.full((len(packed_ids), max_len), pad_id, dtype=torch.long)
+        position_ids = torch.full((len(packed_ids), max_len), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(packed_ids), max_len, max_len), dtype=torch.long)
+        spans = []
+        for row, segments in enumerate(packed_ids):
+            start = 0
+            for ids in segments:
+                end = start + len(ids)
+                input_ids[row, start:end] = torch.tensor(ids, dtype=torch.long)
+                # RoBERTa numbers positions from padding_idx + 1 in every sentence
+                position_ids[row, start:end] = torch.arange(pad_id + 1, pad_id + 1 + len(ids))
+                attention_mask[row, start:end, start:end] = 1
+                spans.append((row, start, end))
+                start = end
+
+        with torch.no_grad():
+            logits = self.model(input_ids.to(self.device),
+                                attention_mask=attention_mask.to(self.device),
+                                position_ids=position_ids.to(self.device))
+            outputs = self.reduce_logits(logits, spans, keep_logits)
+        self.record_exit_depth(len(spans))
+        return outputs
+
+    def split_windows(self, ids):
+        """Tile an encoding longer than max_length into overlapping windows.
+
+        Returns (window_ids, content_start) pairs, where content_start is the offset of the
+        window's first non-special token within the sentence's content tokens.
+        """
+        if self.stride is None or len(ids) <= self.max_length:
+            return [(ids, 0)]
+        bos, content, eos = ids[:1], ids[1:-1], ids[-1:]
+        width = self.max_length - 2
+        step = width - self.stride
+        windows = []
+        for start in range(0, len(content), step):
+            windows.append(([*bos, *content[start:start + width], *eos], start))
+            if start + width >= len(content):
+                break
+        return windows
+
+    def merge_windows(self, num_tokens, windows):
+        """Average overlapping window logits, weighting each token by how far it sits from a window edge"""
+        if len(windows) == 1:
+            return windows[0][1]
+        merged = torch.zeros(num_tokens, windows[0][1].shape[-1])
+        weights = torch.zeros(num_tokens, 1)
+        for start, logits in windows:
+            width = logits.shape[0] - 2
+            k = torch.arange(width)
+            weight = torch.minimum(k + 1, width - k).unsqueeze(1).float()
+            merged[1 + start:1 + start + width] += logits[1:-1] * weight
+            weights[1 + start:1 + start + width] += weight
+        merged[0], weights[0] = windows[0][1][0], 1
+        merged[-1], weights[-1] = windows[-1][1][-1], 1
+        return merged / weights
+
+    def tokenize(self, sentences):
+        """Single tokenizer pass returning input ids and character offsets"""
+        with self.lock:
+            return self.tokenizer(
+                sentences,
+                return_offsets_mapping=True,
+                truncation=self.stride is None,
+                max_length=self.max_length
+            )
+
+    def predict_sentences(self, sentences, encodings=None, full_probabilities=False, progress_bar=False):
+        """Per-sentence (predictions, confidence) in the order of `sentences`.
+
+        `confidence` is each token's max probability; with full_probabilities it is the whole
+        [tokens, labels] probability matrix instead. `encodings` are the input ids from
+        `tokenize`; they are computed when omitted. With a draft tagger, only sentences whose
+        least confident token falls below escalation_threshold are run through this model.
+        progress_bar draws a tqdm bar over the batches on stderr.
+        """
+        if encodings is None:
+            encodings = self.tokenize(sentences)["input_ids"]
+        if self.draft is None:
+            return self.run_model(encodings, full_probabilities, progress_bar)
+
+        outputs = self.draft.predict_sentences(sentences, encodings, full_probabilities, progress_bar)
+        escalate = [i for i, (_, scores) in enumerate(outputs)
+                    if token_confidence(scores).min() < self.escalation_threshold]
+        if escalate:
+            for i, output in zip(escalate, self.run_model([encodings[i] for i in escalate], full_probabilities,
+                                                          progress_bar)):
+                outputs[i] = output
+        self.cascade_stats["sentences"] += len(outputs)
+        self.cascade_stats["escalated"] += len(escalate)
+        return outputs
+
+    def run_model(self, encodings, full_probabilities=False, progress_bar=False):
+        """Batched (or packed) inference over all windows of all encodings"""
+        with self.lock:
+            segments, owners = [], []
+            for i, ids in enumerate(encodings):
+                for window_ids, start in self.split_windows(ids):
+                    segments.append(window_ids)
+                    owners.append((i, start))
+            lengths = [len(ids) for ids in segments]
+            # Logits only leave the device for sentences whose windows must be merged
+            num_windows = np.bincount([i for i, _ in owners], minlength=len(encodings))
+            keep = [full_probabilities or num_windows[i] > 1 for i, _ in owners]
+
+            segment_outputs = [None] * len(segments)
+            if self.packing:
+                for batch in tqdm(self.packed_batches(lengths), unit="batch", disable=not progress_bar):
+                    rows = [j for pack in batch for j in pack]
+                    batch_outputs = self.forward_packed([[segments[j] for j in pack] for pack in batch],
+                                                        [keep[j] for j in rows])
+                    for j, output in zip(rows, batch_outputs):
+                        segment_outputs[j] = output
             else:
-                if category != current_label:
-                    if current_label is not None:
-                        tagged_sentence_parts.append(f"</{current_label}>")
-                    tagged_sentence_parts.append(f"<{category}>")
-                    current_label = category
-                if word.startswith("##"):
-                    tagged_sentence_parts[-1] += word[2:]
-                else:
-                    if tagged_sentence_parts and not tagged_sentence_parts[-1].endswith(">"):
-                        tagged_sentence_parts.append(" ")
-                    tagged_sentence_parts.append(word)
-        if current_label is not None:
-            tagged_sentence_parts.append(f"</{current_label}>")
-
-        tagged_sentence = "".join(tagged_sentence_parts)
-
-        row = {
-            "ReportingSentence": clean_sentence,
-            "tagged_sentences": tagged_sentence,
-            "cue": self.extract_labeled_text(tagged_sentence, "cue"),
-            "source": self.extract_labeled_text(tagged_sentence, "source"),
-            "content": self.extract_labeled_text(tagged_sentence, "content"),
-            "hinge": self.extract_labeled_text(tagged_sentence, "hinge"),
-            "residue": self.extract_labeled_text(tagged_sentence, "residue"),
-        }
+                for batch in tqdm(self.length_buckets(lengths), unit="batch", disable=not progress_bar):
+                    batch_outputs = self.forward_batch([segments[j] for j in batch], [keep[j] for j in batch])
+                    for j, output in zip(batch, batch_outputs):
+                        segment_outputs[j] = output
+
+            windows = [[] for _ in encodings]
+            for (i, start), output in zip(owners, segment_outputs):
+                windows[i].append((start, output))
+
+            outputs = []
+            for ids, sentence_windows in zip(encodings, windows):
+                if len(sentence_windows) == 1 and not full_probabilities:
+                    labels, confidence = sentence_windows[0][1]
+                    outputs.append((labels.numpy().astype(np.int64), confidence.numpy()))
+                    continue
+                probabilities = torch.nn.functional.softmax(self.merge_windows(len(ids), sentence_windows), dim=-1)
+                confidence, labels = probabilities.max(dim=-1)
+                outputs.append((labels.numpy(), (probabilities if full_probabilities else confidence).numpy()))
+            return outputs
+
+    def decode_spans(self, sentence, predictions, offsets, scores=None):
+        """Tagged sentence and per-category spans, sliced from `sentence` by character offsets.
+
+        Contiguous runs of one label are found on the label array directly; special and
+        whitespace-only tokens (no visible characters) are skipped so they never split a run.
+        `scores` (from predict_sentences) feed the span_confidence and debug_probabilities columns.
+        """
+        offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)[:len(predictions)]
+        labels = np.asarray(predictions)[:len(offsets)]
+
+        codepoints = np.frombuffer(sentence.encode("utf-32-le"), dtype=np.uint32)
+        visible = np.concatenate(([0], np.cumsum(~np.isin(codepoints, WHITESPACE_CODEPOINTS))))
+        keep = visible[offsets[:, 1]] > visible[offsets[:, 0]]
+        labels, offsets = labels[keep], offsets[keep]
+
+        starts = np.flatnonzero(np.diff(labels, prepend=-1))
+        ends = np.append(starts[1:], len(labels)) - 1
+        # Mean token confidence of every run
+        run_confidence = np.zeros(len(starts))
+        if self.span_confidence and scores is not None and len(starts):
+            confidence = token_confidence(np.asarray(scores))[:len(keep)][keep]
+            run_confidence = np.add.reduceat(confidence, starts) / (ends - starts + 1)
+
+        spans = {category: [] for category in SPAN_CATEGORIES}
+        confidences = {category: [] for category in SPAN_CATEGORIES}
+        tagged_parts = []
+        position = 0
+        for category, start, end, mean in zip(self.categories[labels[starts]],
+                                              offsets[starts, 0], offsets[ends, 1], run_confidence):
+            if category == "O":
+                continue
+            text = sentence[start:end]
+            tagged_parts.append(f"{sentence[position:start]}<{category}>{text}</{category}>")
+            spans[category].append(text.strip())
+            confidences[category].append(f"{mean:.3f}")
+            position = end
+        tagged_parts.append(sentence[position:])
+
+        row = {"tagged_sentences": "".join(tagged_parts)}
+        for category in SPAN_CATEGORIES:
+            row[category] = "///".join(spans[category]) if spans[category] else "N/A"
+        if self.span_confidence:
+            for category in SPAN_CATEGORIES:
+                row[f"{category}_confidence"] = "///".join(confidences[category]) if confidences[category] else "N/A"
+        if self.debug_probabilities and scores is not None:
+            row["probabilities"] = json.dumps(np.round(np.asarray(scores, dtype=np.float64), 4).tolist())
         return row
 
-    def extract_labeled_text(self, tagged_sentence, tag):
-        matches = re.findall(fr"<{tag}>(.*?)(?=(</{tag}>|$))", tagged_sentence)
-        return "///".join(match[0].strip() for match in matches) if matches else "N/A"
+    def tag_sentences(self, sentences, encodings=None, progress_bar=False):
+        """Decoded spans per sentence; cache hits skip tokenization and the forward pass.
 
-    def predict_dataset(self, input_csv, output_csv="predicted_result.csv"):
-        df = pd.read_csv(input_csv)
-        results = []
-        print('Predicting labels for the dataset...')
+        `encodings` (input_ids and offset_mapping per sentence) are computed when omitted.
+        """
+        if self.cache is None:
+            return self.tag_sentences_uncached(sentences, encodings, progress_bar)
 
-        for index, row in tqdm(df.iterrows(), total=len(df)):
-            no = row.get("No.", index)
-            text_id = row.get("TextID", f"row-{index}")
-            context = str(row.get("Context", ""))
-            reporting_sentence = str(row.get("ReportingSentence", ""))
+        keys = [self.cache.sentence_key(self.cache_namespace, sentence) for sentence in sentences]
+        cached = self.cache.get_many(keys)
+        # Repeated sentences inside one call are tagged once
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in cached:
+                missing.setdefault(key, i)
+        if missing:
+            rows = list(missing.values())
+            missing_encodings = None
+            if encodings is not None:
+                missing_encodings = {name: [encodings[name][i] for i in rows]
+                                     for name in ("input_ids", "offset_mapping")}
+            computed = dict(zip(missing, self.tag_sentences_uncached([sentences[i] for i in rows],
+                                                                     missing_encodings, progress_bar)))
+            self.cache.put_many(computed.items())
+            cached.update(computed)
+        return [dict(cached[key]) for key in keys]
 
-            inputs = self.tokenizer(
-                reporting_sentence,
-                truncation=True,
-                max_length=512,
-                return_tensors="pt"
-            ).to(self.device)
+    def tag_sentences_uncached(self, sentences, encodings=None, progress_bar=False):
+        """Tokenize once, run batched inference and decode the spans of every sentence"""
+        if not sentences:
+            return []
+        if encodings is None:
+            encodings = self.tokenize(sentences)
+        outputs = self.predict_sentences(sentences, encodings["input_ids"], self.debug_probabilities, progress_bar)
+        return [self.decode_spans(sentence, predictions, offsets, scores)
+                for sentence, (predictions, scores), offsets
+                in zip(sentences, outputs, encodings["offset_mapping"])]
 
-            with torch.no_grad():
-                logits = self.model(inputs['input_ids'], attention_mask=inputs['attention_mask'])
-                probabilities = torch.nn.functional.softmax(logits, dim=-1)[0].cpu().numpy()
-                predictions = logits.argmax(dim=-1)[0].cpu().numpy()
+    def predict_stream(self, input_csv, chunk_size=1000, progress=None, progress_bar=False):
+        """Yield result rows, reading and tagging the input chunk_size rows at a time.
 
-            offsets = self.tokenizer(
-                reporting_sentence,
-                return_offsets_mapping=True,
-                truncation=True,
-                max_length=512
-            )["offset_mapping"]
+        `progress(done, total, rate, eta)` is called after every chunk with rows done, total
+        rows, sentences per second and the estimated seconds left. With tokenized_cache set,
+        encodings come from the input file's memory-mapped Arrow dataset.
+        """
+        total = count_rows(input_csv) if progress is not None else None
+        dataset = None
+        if self.tokenized_cache is not None:
+            from tokenized_cache import tokenized_dataset, tokenized_rows
 
-            token_results = []
-            for idx in range(len(predictions)):
-                if idx >= len(offsets):
-                    break
-                start, end = offsets[idx]
-                word = reporting_sentence[start:end]
-                pred_label = self.id2label.get(predictions[idx], "N/A")
-                token_results.append({
-                    "word": word,
-                    "pred_label": pred_label,
-                    "probability": max(probabilities[idx]),
-                    "probabilities": probabilities[idx].tolist(),
-                })
-
-            processed_row = self.process_token_results(token_results)
-
-            final_row = {
-                "No.": no,
-                "TextID": text_id,
-                "Context": context,
-                "ReportingSentence": reporting_sentence,
-                "tagged_sentences": processed_row["tagged_sentences"],
-                "cue": processed_row["cue"],
-                "source": processed_row["source"],
-                "content": processed_row["content"],
-                "hinge": processed_row["hinge"],
-                "residue": processed_row["residue"],
-            }
-            results.append(final_row)
-
-        df_out = pd.DataFrame(results)
-        df_out.to_csv(output_csv, index=False, encoding='utf-8')
+            dataset = tokenized_dataset(self, input_csv, self.tokenized_cache)
+        done = 0
+        start = time.perf_counter()
+        if progress is not None:
+            progress(0, total, 0.0, None)
+        with pd.read_csv(input_csv, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                rows = [(index, row) for index, row in chunk.iterrows()]
+                sentences = [str(row.get("ReportingSentence", "")) for _, row in rows]
+                encodings = tokenized_rows(dataset, done, done + len(rows)) if dataset is not None else None
+                tagged = self.tag_sentences(sentences, encodings, progress_bar)
+
+                done += len(rows)
+                if progress is not None:
+                    rate = done / max(time.perf_counter() - start, 1e-9)
+                    progress(done, total, rate, max(total - done, 0) / rate)
+
+                for (index, row), reporting_sentence, spans in zip(rows, sentences, tagged):
+                    yield {
+                        "No.": row.get("No.", index),
+                        "TextID": row.get("TextID", f"row-{index}"),
+                        "Context": str(row.get("Context", "")),
+                        "ReportingSentence": reporting_sentence,
+                        **spans,
+                    }
+
+    def predict_dataset(self, input_csv, output_csv="predicted_result.csv", chunk_size=1000, progress=None):
+        print('Predicting labels for the dataset...')
+        stream = self.predict_stream(input_csv, chunk_size, progress, progress_bar=True)
+        results = list(write_rows(stream, output_csv, chunk_size))
         print(f"Prediction results saved to '{output_csv}'.")
         return results
 
-
 if __name__ == "__main__":
-    GITHUB_MODEL_URL = "https://github.com/PseudoInsider/autoRecognition/releases/download/v1.0/V1-model.bin"
-
     tagger = IOTagger(
         model_path='V1-model.bin',
-        model_url=GITHUB_MODEL_URL
+        model_url=MODEL_URL,
+        model_sha256=MODEL_SHA256
     )
 
     results = tagger.predict_dataset(
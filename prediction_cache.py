@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_checksum(model_path):
+    """SHA-256 of the weights, memoised in a <model>.sha256 sidecar while size and mtime match"""
+    stat = os.stat(model_path)
+    sidecar = model_path + ".sha256"
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            checksum, size, mtime = f.read().split()
+        if int(size) == stat.st_size and float(mtime) == stat.st_mtime:
+            return checksum
+
+    checksum = file_sha256(model_path)
+    with open(sidecar, "w", encoding="utf-8") as f:
+        f.write(f"{checksum} {stat.st_size} {stat.st_mtime}")
+    return checksum
+
+
+class PredictionCache:
+    """On-disk (SQLite) cache of decoded spans, keyed by model checksum and exact sentence.
+
+    Entries carry a last-used timestamp; once the table grows past max_entries the least
+    recently used tenth is evicted. The file can be shared by concurrent runs and sessions.
+    """
+
+    def __init__(self, path="prediction_cache.sqlite", max_entries=500_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, spans TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+
+    @staticmethod
+    def sentence_key(namespace, sentence):
+        """`namespace` identifies the model and settings that produced the spans.
+
+        The sentence is used verbatim: the stored row quotes it character by character and
+        whitespace changes its tokenization, so only identical text may share an entry.
+        """
+        return hashlib.sha256(f"{namespace}\0{sentence}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Cached spans for the keys that are present; refreshes their LRU timestamp"""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self.lock, self.conn:
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, spans FROM predictions WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, json.loads(spans)) for key, spans in rows)
+            self.conn.executemany("UPDATE predictions SET last_used = ? WHERE key = ?",
+                                  [(time.time(), key) for key in found])
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        """Store (key, spans) pairs, then evict least recently used entries beyond max_entries"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, spans, last_used) VALUES (?, ?, ?)",
+                [(key, json.dumps(spans, ensure_ascii=False), now) for key, spans in items]
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - int(self.max_entries * 0.9)
+                self.conn.execute(
+                    "DELETE FROM predictions WHERE key IN "
+                    "(SELECT key FROM predictions ORDER BY last_used LIMIT ?)", (excess,)
+                )
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,10 +1,13 @@
 import os
+import time
 import pandas as pd
 import spacy
 import logging
 import re
 from spacy.tokens import Token
 
+from reporting_lexicon import LexicalPrefilter, compiled_matcher
+
 # __order__ = 7
 class PreprocessText:
     def __init__(self, config):
@@ -12,6 +15,14 @@ class PreprocessText:
         self.nlp = spacy.load("en_core_web_sm")
         self.context_range = config.get("context_range", 50)
         self.max_merge = config.get("max_merge", 3)
+        # nlp.pipe settings for the parsing pass: sentences per batch and worker processes
+        self.batch_size = config.get("batch_size", 64)
+        self.n_process = config.get("n_process", 1)
+        # Skip parsing sentences that contain no inflected form of any reporting verb
+        self.prefilter = config.get("prefilter", True)
+        self.prefilter_stats = {"sentences": 0, "skipped": 0}
+        # Compiled lexicon/rule matchers, looked up by lexicon hash at the start of each run
+        self.verb_matcher = None
         self.reporting_verbs_file = config["reporting_verbs_file"]
         self.output_path = os.path.join(os.path.dirname(__file__), config["output_directory"], "output.csv")
         self.input_path = os.path.join(os.path.dirname(__file__), config["input_directory"])
@@ -97,56 +108,24 @@ class PreprocessText:
 
         return final_sents
 
-    def validate_reporting_verbs(self, doc, reporting_verbs):
-        """Enhanced reporting verb detection with comprehensive validation"""
-        verbs = []
-
-        for token in doc:
-            # Basic verb validation
-            if token.pos_ in {"VERB", "AUX"} and token.lemma_.lower() in reporting_verbs:
-                # Check for subject dependencies
-                has_subject = any(child.dep_ in {"nsubj", "nsubjpass"} for child in token.children)
-
-                # Check for object dependencies
-                has_object = any(
-                    child.dep_ in {"dobj", "iobj", "pobj", "attr", "oprd"}
-                    for child in token.children
-                )
-
-                # Check for clausal complements
-                has_clause = any(
-                    child.dep_ in {"ccomp", "xcomp", "acl", "advcl", "relcl"}
-                    for child in token.children
-                )
-
-                # Check for prepositional complements
-                has_prep = any(
-                    child.dep_ == "prep" and any(
-                        grandchild.dep_ in {"pobj", "pcomp"}
-                        for grandchild in child.children
-                    )
-                    for child in token.children
-                )
-
-                # Check for reporting patterns
-                has_reporting_pattern = (
-                        has_subject or  # Subject + verb
-                        has_object or  # Verb + object
-                        has_clause or  # Verb + clause
-                        has_prep  # Verb + prepositional phrase
-                )
-
-                # Additional validation for direct speech
-                has_direct_speech = any(
-                    child.text in {'"', '“', '”'} or child.is_quote
-                    for child in token.subtree
-                )
-
-                # If any valid pattern is found
-                if has_reporting_pattern or has_direct_speech:
-                    verbs.append(token)
-
-        return verbs
+    def validate_reporting_verbs(self, doc):
+        """Reporting verbs of `doc`: lexicon verbs (single- or multi-word) with a subject, object,
+        clausal or prepositional complement, or direct speech below them.
+
+        The lexicon and these rules are compiled once per lexicon file into spaCy matchers
+        (see reporting_lexicon.ReportingVerbMatcher), so each Doc is matched in one pass.
+        """
+        if self.verb_matcher is None:
+            self.verb_matcher = compiled_matcher(self.nlp, self.reporting_verbs_file)
+        return self.verb_matcher.reporting_verbs(doc)
+
+    def parse_sentences(self, candidates):
+        """Stream (idx, file_name, sentence) triples through nlp.pipe, yielding (doc, (file_name, idx)) in input order"""
+        texts = ((sentence, (file_name, idx)) for idx, file_name, sentence in candidates)
+        # Entities are never used downstream, so the NER component is skipped
+        disabled = [name for name in ("ner",) if name in self.nlp.pipe_names]
+        with self.nlp.select_pipes(disable=disabled):
+            yield from self.nlp.pipe(texts, as_tuples=True, batch_size=self.batch_size, n_process=self.n_process)
 
     def preprocess_text(self):
         """Main processing with linguistic validation"""
@@ -155,24 +134,31 @@ class PreprocessText:
             return
 
         try:
-            # Load reporting verbs with validation
-            with open(self.reporting_verbs_file, 'r', encoding='utf-8') as f:
-                reporting_verbs = {line.strip().lower() for line in f if line.strip()}
-
+            self.verb_matcher = compiled_matcher(self.nlp, self.reporting_verbs_file)
             all_sentences = self.read_file(self.input_path)
             if not all_sentences:
                 logging.warning("No sentences extracted from input files.")
                 return
 
+            start_time = time.perf_counter()
+            candidates = [(idx, file_name, sentence) for idx, (file_name, sentence) in enumerate(all_sentences)]
+            if self.prefilter:
+                prefilter = LexicalPrefilter(self.reporting_verbs_file)
+                candidates = [candidate for candidate in candidates if prefilter.matches(candidate[2])]
+                logging.info(f"Lexical prefilter skipped {len(all_sentences) - len(candidates)} of "
+                             f"{len(all_sentences)} sentences "
+                             f"({(len(all_sentences) - len(candidates)) / len(all_sentences):.1%})")
+            self.prefilter_stats = {"sentences": len(all_sentences),
+                                    "skipped": len(all_sentences) - len(candidates)}
+
             all_rows = []
-            for idx, (file_name, sentence) in enumerate(all_sentences):
+            for doc, (file_name, idx) in self.parse_sentences(candidates):
                 # Process with original text preservation
-                doc = self.nlp(sentence)
                 for token in doc:
                     token._.original_text = token.text
 
                 # Validate reporting verbs linguistically
-                verbs = self.validate_reporting_verbs(doc, reporting_verbs)
+                verbs = self.validate_reporting_verbs(doc)
                 if not verbs:
                     continue
 
@@ -196,6 +182,11 @@ class PreprocessText:
                     " ".join(modified).replace(" n't", "n't")  # Fix contractions
                 ])
 
+            elapsed = time.perf_counter() - start_time
+            logging.info(f"Processed {len(all_sentences)} sentences ({len(candidates)} parsed) in {elapsed:.1f}s "
+                         f"({len(all_sentences) / max(elapsed, 1e-9):.1f} sentences/s, "
+                         f"batch_size={self.batch_size}, n_process={self.n_process})")
+
             if all_rows:
                 os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
                 df = pd.DataFrame(all_rows, columns=["No.", "TextID", "Context", "ReportingSentence"])
@@ -212,6 +203,9 @@ def main():
     config = {
         'context_range': 3,
         'max_merge': 3,
+        'batch_size': 64,
+        'n_process': 1,
+        'prefilter': True,
         'reporting_verbs_file': 'reporting_verbs.csv',
         'output_directory': 'output',
         'input_directory': 'test',
@@ -0,0 +1,131 @@
+"""Structured pruning of the V1 tagger with a label-agreement floor.
+
+    python prune.py --min-agreement 0.98 --output-path V1-pruned.bin
+    python -c "from predict import IOTagger; IOTagger(model_path='V1-pruned.bin')"
+
+Attention heads are ranked by the gradient-based importance of Michel et al. (2019),
+measured against V1's own labels on the reference sentences. Each candidate keeps the
+lowest `layers` encoder layers and drops the least important `head_fraction` of the
+remaining heads. Every candidate is scored for token-label agreement with the unpruned
+model, latency and weight size; the most aggressive one that stays above
+--min-agreement is saved together with its config (V1-pruned-config.json, which records
+num_hidden_layers and pruned_heads so IOTagger rebuilds the smaller architecture).
+"""
+import argparse
+import copy
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+
+from distill import collate
+from evaluate_backends import add_reference_arguments, label_agreement, reference_sentences
+from predict import IOTagger, RoBERTaTokenClassifier, save_checkpoint
+
+
+def head_importance(model, examples, pad_id, batch_size=16):
+    """|d loss / d head_mask| per (layer, head), with the model's own argmax as the target"""
+    config = model.roberta.config
+    head_mask = torch.ones(config.num_hidden_layers, config.num_attention_heads, requires_grad=True)
+    importance = torch.zeros_like(head_mask)
+    for i in range(0, len(examples), batch_size):
+        input_ids, attention_mask, targets = collate(examples[i:i + batch_size], pad_id)
+        hidden = model.roberta(input_ids=input_ids, attention_mask=attention_mask,
+                               head_mask=head_mask).last_hidden_state
+        logits = model.classifier(hidden)
+        mask = attention_mask.bool()
+        loss = F.cross_entropy(logits[mask], targets[mask].argmax(dim=-1))
+        (grad,) = torch.autograd.grad(loss, head_mask)
+        importance += grad.abs()
+    return importance
+
+
+def prune_model(model, importance, layers, head_fraction):
+    """Copy of `model` with only the first `layers` layers and the least important heads removed"""
+    pruned = copy.deepcopy(model)
+    pruned.roberta.encoder.layer = pruned.roberta.encoder.layer[:layers]
+    pruned.roberta.config.num_hidden_layers = layers
+
+    scores = importance[:layers]
+    heads_per_layer = scores.shape[1]
+    to_prune = {}
+    order = scores.flatten().argsort()
+    for index in order[:int(head_fraction * scores.numel())].tolist():
+        layer, head = divmod(index, heads_per_layer)
+        # Keep at least one head in every layer
+        if len(to_prune.get(layer, [])) < heads_per_layer - 1:
+            to_prune.setdefault(layer, []).append(head)
+    if to_prune:
+        pruned.roberta.prune_heads(to_prune)
+    return pruned.eval()
+
+
+def weight_mb(model):
+    return sum(p.numel() * p.element_size() for p in model.parameters()) / 2 ** 20
+
+
+def evaluate_candidate(reference_tagger, model, sentences, encodings, full_probabilities=False):
+    """Run `model` through the reference tagger's batching and decoding; (outputs, seconds)"""
+    tagger = copy.copy(reference_tagger)
+    tagger.model = model
+    tagger.lock = threading.RLock()
+    start = time.perf_counter()
+    outputs = tagger.predict_sentences(sentences, encodings, full_probabilities)
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_reference_arguments(parser)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--output-path", default="V1-pruned.bin")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--layers", type=int, nargs="+", default=[24, 20, 16, 12, 8])
+    parser.add_argument("--head-fractions", type=float, nargs="+", default=[0.0, 0.25, 0.5])
+    args = parser.parse_args()
+
+    sentences = reference_sentences(args.input_csv, args.input_directory, args.limit)
+    tagger = IOTagger(model_path=args.model_path)
+    if not isinstance(tagger.model, RoBERTaTokenClassifier):
+        raise ValueError("Pruning needs the torch backend")
+    model = tagger.model.cpu()
+    tagger.device = torch.device("cpu")
+    encodings = tagger.tokenize(sentences)["input_ids"]
+
+    reference_outputs, reference_time = evaluate_candidate(tagger, model, sentences, encodings,
+                                                           full_probabilities=True)
+    examples = [(ids, probabilities) for ids, (_, probabilities) in zip(encodings, reference_outputs)]
+    importance = head_importance(model, examples, tagger.tokenizer.pad_token_id)
+
+    total_layers = model.roberta.config.num_hidden_layers
+    candidates = [(layers, fraction) for layers in args.layers if layers <= total_layers
+                  for fraction in args.head_fractions]
+    print(f"{'layers':>6} {'heads cut':>9} {'weights MB':>10} {'ms/sent':>8} {'agreement':>9}")
+    print(f"{total_layers:>6} {0:>9.0%} {weight_mb(model):>10.1f} "
+          f"{1000 * reference_time / len(sentences):>8.2f} {1:>9.2%}  (unpruned)")
+
+    results = []
+    for layers, fraction in candidates:
+        pruned = prune_model(model, importance, layers, fraction)
+        outputs, seconds = evaluate_candidate(tagger, pruned, sentences, encodings)
+        agreement = label_agreement(reference_outputs, outputs)["token_agreement"]
+        size = weight_mb(pruned)
+        print(f"{layers:>6} {fraction:>9.0%} {size:>10.1f} {1000 * seconds / len(sentences):>8.2f} "
+              f"{agreement:>9.2%}")
+        results.append((size, layers, fraction, agreement))
+        del pruned
+
+    passing = [result for result in results if result[3] >= args.min_agreement]
+    if not passing:
+        print(f"No candidate reaches {args.min_agreement:.2%} agreement; nothing saved.")
+        return
+    _, layers, fraction, agreement = min(passing)
+    best = prune_model(model, importance, layers, fraction)
+    save_checkpoint(best, tagger.tokenizer, args.output_path)
+    print(f"✅ Saved {layers} layers with {fraction:.0%} of heads cut ({agreement:.2%} agreement) "
+          f"to '{args.output_path}'")
+
+
+if __name__ == "__main__":
+    main()
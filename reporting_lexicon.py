@@ -0,0 +1,203 @@
+"""Reporting-verb lexicon: surface-form prefilter index and compiled spaCy matchers.
+
+Every entry's verb (the first word of multi-word entries such as "abide by") is expanded
+into its inflected forms: the inverse of spaCy's English verb suffix rules, -ied and a
+final-consonant doubling (over-generated on purpose so nothing the lemmatizer would map
+back to the lexicon is missed), plus the irregular forms below. The
+index is saved next to the lexicon (reporting_verbs-forms.json) and rebuilt whenever the
+lexicon's SHA-256 changes.
+
+ReportingVerbMatcher compiles the lexicon into PhraseMatchers: single-word entries by
+LEMMA and multi-word entries ("abide by", "according to") by LOWER over their inflected
+surface forms. Each Doc is matched in one hash-based pass. PreprocessText's validation
+rules (subject, object, clausal or prepositional complement, direct speech) are compiled
+into dependency-label sets checked in a single scan of each candidate's children; the
+subtree is only walked when a quotation mark lies between its edges.
+"""
+import json
+import os
+import re
+import threading
+
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc
+
+from prediction_cache import file_sha256
+
+# Bump when inflections() changes so cached indexes are rebuilt
+FORMS_VERSION = 2
+
+# (form suffix, lemma suffix) rules of spaCy's English rule lemmatizer for verbs
+VERB_SUFFIX_RULES = [("s", ""), ("ies", "y"), ("es", "e"), ("es", ""),
+                     ("ed", "e"), ("ed", ""), ("ing", "e"), ("ing", "")]
+
+# Every verb-table entry of spaCy's English lemma exceptions (spacy-lookups-data en_lemma_exc)
+# whose lemma is a lexicon verb; extend it when verbs are added to reporting_verbs.csv
+IRREGULAR_FORMS = {
+    "abide": ["abode"],
+    "address": ["addrest"],
+    "awake": ["awoke", "awoken"],
+    "beseech": ["besought"],
+    "begin": ["began", "begun"],
+    "break": ["broke", "broken"],
+    "find": ["found"],
+    "mean": ["meant"],
+    "retell": ["retold"],
+    "say": ["said"],
+    "show": ["shown"],
+    "sing": ["sang", "sung"],
+    "speak": ["spoke", "spoken"],
+    "spit": ["spat"],
+    "swear": ["swore", "sworn"],
+    "tell": ["told"],
+    "think": ["thought"],
+    "wake": ["woke", "woken"],
+    "weep": ["wept"],
+    "write": ["wrote", "written"],
+}
+
+VOWELS = set("aeiou")
+WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def load_reporting_verbs(path):
+    """Lower-cased lexicon entries (utf-8-sig, so a byte-order mark never sticks to the first one)"""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return {line.strip().lower() for line in f if line.strip()}
+
+
+def inflections(verb):
+    """Base form plus every regular and irregular inflection of a single-word verb"""
+    forms = {verb, verb + "s", verb + "es", verb + "ed", verb + "d", verb + "ing"}
+    for form_suffix, lemma_suffix in VERB_SUFFIX_RULES:
+        if verb.endswith(lemma_suffix):
+            forms.add(verb[:len(verb) - len(lemma_suffix)] + form_suffix)
+    if len(verb) > 1 and verb.endswith("y") and verb[-2] not in VOWELS:
+        forms.add(verb[:-1] + "ied")
+    if verb.endswith("ie"):
+        forms.add(verb[:-2] + "ying")
+    # Consonant-vowel-consonant endings may double the last letter (refer -> referred, travel -> travelled)
+    if len(verb) > 2 and verb[-1] not in VOWELS | set("wxy") and verb[-2] in VOWELS and verb[-3] not in VOWELS:
+        forms.update({verb + verb[-1] + "ed", verb + verb[-1] + "ing"})
+    forms.update(IRREGULAR_FORMS.get(verb, []))
+    return forms
+
+
+def build_form_index(entries):
+    forms = set()
+    for entry in entries:
+        words = entry.split()
+        if words:
+            forms.update(inflections(words[0]))
+    return forms
+
+
+def form_index_path(lexicon_path):
+    """Cached index next to the lexicon, e.g. reporting_verbs.csv -> reporting_verbs-forms.json"""
+    root, _ = os.path.splitext(lexicon_path)
+    return f"{root}-forms.json"
+
+
+def load_form_index(lexicon_path):
+    """Inflected forms of the lexicon, read from the cached index while it matches the lexicon"""
+    checksum = file_sha256(lexicon_path)
+    index_path = form_index_path(lexicon_path)
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["lexicon_sha256"] == checksum and cached["version"] == FORMS_VERSION:
+            return set(cached["forms"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    forms = build_form_index(load_reporting_verbs(lexicon_path))
+    try:
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"lexicon_sha256": checksum, "version": FORMS_VERSION, "forms": sorted(forms)}, f)
+        os.replace(index_path + ".tmp", index_path)
+    except OSError:
+        # Read-only checkout: keep the index in memory only
+        pass
+    return forms
+
+
+class LexicalPrefilter:
+    """Cheap test of whether a raw sentence contains any surface form of a reporting verb"""
+
+    def __init__(self, lexicon_path):
+        self.forms = frozenset(load_form_index(lexicon_path))
+
+    def matches(self, sentence):
+        return not self.forms.isdisjoint(WORD_RE.findall(sentence.lower()))
+
+
+VERB_POS = {"VERB", "AUX"}
+# Child dependencies that make a lexicon verb a reporting verb, as in the original token loop
+REPORTING_CHILD_DEPS = frozenset({
+    "nsubj", "nsubjpass",                           # subject
+    "dobj", "iobj", "pobj", "attr", "oprd",         # object
+    "ccomp", "xcomp", "acl", "advcl", "relcl",      # clausal complement
+})
+PREP_OBJECT_DEPS = frozenset({"pobj", "pcomp"})
+QUOTES = frozenset({'"', "“", "”"})
+
+
+def lemma_variants(words):
+    """Lemmas compare lower-cased; the matcher is case-sensitive, so list the usual casings"""
+    return sorted({variant for word in words for variant in (word, word.capitalize(), word.upper())})
+
+
+def has_reporting_pattern(token):
+    """Subject, object, clausal or prepositional complement, or a quotation mark in the subtree"""
+    for child in token.children:
+        if child.dep_ in REPORTING_CHILD_DEPS:
+            return True
+        if child.dep_ == "prep" and any(grandchild.dep_ in PREP_OBJECT_DEPS for grandchild in child.children):
+            return True
+    # The subtree lies within [left_edge, right_edge]; walk it only if that span has a quote
+    span = token.doc[token.left_edge.i:token.right_edge.i + 1]
+    if not any(t.is_quote or t.text in QUOTES for t in span):
+        return False
+    return any(t.is_quote or t.text in QUOTES for t in token.subtree)
+
+
+class ReportingVerbMatcher:
+    """Lexicon compiled into spaCy PhraseMatchers for one vocabulary"""
+
+    def __init__(self, nlp, lexicon_path):
+        entries = load_reporting_verbs(lexicon_path)
+        single_verbs = [entry for entry in entries if len(entry.split()) == 1]
+        phrases = [entry.split() for entry in entries if len(entry.split()) > 1]
+
+        # Pattern docs carry the lemma directly, so no pipeline has to run over the lexicon
+        self.lemmas = PhraseMatcher(nlp.vocab, attr="LEMMA")
+        patterns = []
+        for lemma in lemma_variants(single_verbs):
+            pattern = Doc(nlp.vocab, words=[lemma])
+            pattern[0].lemma_ = lemma
+            patterns.append(pattern)
+        self.lemmas.add("single_word", patterns)
+
+        self.phrases = PhraseMatcher(nlp.vocab, attr="LOWER")
+        surface = [" ".join([form, *words[1:]]) for words in phrases for form in sorted(inflections(words[0]))]
+        self.phrases.add("multi_word", list(nlp.tokenizer.pipe(surface)))
+
+    def reporting_verbs(self, doc):
+        """Tokens of `doc` that are lexicon verbs with a reporting pattern, in document order"""
+        # Single-word entries by lemma; multi-word entries by the phrase's first token
+        starts = {start for _, start, _ in self.lemmas(doc)}
+        starts.update(start for _, start, _ in self.phrases(doc))
+        return [doc[i] for i in sorted(starts) if doc[i].pos_ in VERB_POS and has_reporting_pattern(doc[i])]
+
+
+# Compiled matchers per (lexicon SHA-256, vocabulary), shared by every PreprocessText instance
+compiled_matchers = {}
+compiled_matchers_lock = threading.Lock()
+
+
+def compiled_matcher(nlp, lexicon_path):
+    key = (file_sha256(lexicon_path), id(nlp.vocab))
+    with compiled_matchers_lock:
+        if key not in compiled_matchers:
+            compiled_matchers[key] = ReportingVerbMatcher(nlp, lexicon_path)
+        return compiled_matchers[key]
@@ -0,0 +1,104 @@
+import gc
+import os
+import threading
+
+import psutil
+import torch
+
+from predict import IOTagger, TracedTokenClassifier, onnx_model_path
+
+
+def tensor_bytes(value):
+    """Bytes held by a state_dict entry (quantized Linear layers store a (weight, bias) tuple)"""
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_bytes(item) for item in value)
+    return 0
+
+
+class TaggerRegistry:
+    """Process-wide IOTagger instances, loaded once per model/backend and shared by every session.
+
+    Streamlit re-executes page scripts on each rerun but imports modules only once per process,
+    so the module-level `registry` below outlives sessions and reruns.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.taggers = {}
+        self.loading = {}
+
+    @staticmethod
+    def key(model_path, backend, options):
+        # List-valued options (e.g. compile_lengths=[32, 64]) are keyed as tuples
+        options = tuple(sorted((name, tuple(value) if isinstance(value, (list, tuple)) else value)
+                               for name, value in options.items()))
+        return os.path.abspath(model_path), backend, options
+
+    def get(self, model_path="V1-model.bin", backend="torch", **options):
+        """Return the shared tagger for this configuration, loading it on first request"""
+        key = self.key(model_path, backend, options)
+        with self.lock:
+            if key in self.taggers:
+                return self.taggers[key]
+            # One lock per configuration: concurrent first requests wait for a single load
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                if key in self.taggers:
+                    return self.taggers[key]
+            tagger = IOTagger(model_path=model_path, backend=backend, **options)
+            with self.lock:
+                self.taggers[key] = tagger
+                self.loading.pop(key, None)
+            return tagger
+
+    def unload(self, model_path="V1-model.bin", backend="torch", **options):
+        """Drop a shared tagger; sessions still holding it keep working until they let go"""
+        with self.lock:
+            tagger = self.taggers.pop(self.key(model_path, backend, options), None)
+        del tagger
+        gc.collect()
+
+    def unload_all(self):
+        with self.lock:
+            self.taggers.clear()
+        gc.collect()
+
+    def reload(self, model_path="V1-model.bin", backend="torch", **options):
+        """Unload and load again, e.g. after V1-model.bin was replaced on disk"""
+        self.unload(model_path, backend, **options)
+        return self.get(model_path, backend, **options)
+
+    def memory_report(self):
+        """Resident set size of the process and the weight bytes held by each loaded tagger"""
+        with self.lock:
+            loaded = list(self.taggers.items())
+
+        taggers = []
+        for (model_path, backend, options), tagger in loaded:
+            if backend == "onnx":
+                weight_bytes = os.path.getsize(onnx_model_path(model_path))
+            else:
+                # Traced taggers wrap the eager model they fall back to
+                model = tagger.model.model if isinstance(tagger.model, TracedTokenClassifier) else tagger.model
+                weight_bytes = sum(tensor_bytes(value) for value in model.state_dict().values())
+            taggers.append({
+                "model_path": model_path,
+                "backend": backend,
+                "options": dict(options),
+                "weight_mb": weight_bytes / 2 ** 20,
+            })
+        return {
+            "rss_mb": psutil.Process().memory_info().rss / 2 ** 20,
+            "taggers": taggers,
+        }
+
+
+registry = TaggerRegistry()
+
+
+def get_tagger(model_path="V1-model.bin", backend="torch", **options):
+    return registry.get(model_path, backend, **options)
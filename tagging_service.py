@@ -0,0 +1,187 @@
+"""Local HTTP service around IOTagger with dynamic micro-batching.
+
+    python tagging_service.py --port 8765 --max-batch-size 32 --max-wait-ms 10
+    curl -s localhost:8765/tag -d '{"sentences": ["He said it would rain."]}'
+
+POST /tag takes {"sentences": [...]} and returns {"results": [spans, ...]} in the same
+order. Requests are queued; a single inference loop takes whatever is waiting, up to
+--max-batch-size sentences or --max-wait-ms after the first one arrived, tags it in one
+IOTagger call on a worker thread and resolves each request with its own slice. A request
+that would overflow the batch waits for the next one; a single request larger than
+--max-batch-size is tagged on its own. At most
+--max-pending requests may be waiting; beyond that the service answers 503 straight away.
+GET /health reports the queue depth and batching counters.
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+from tagger_registry import get_tagger
+
+
+class MicroBatcher:
+    """Collects sentences from concurrent requests into batches for one inference loop"""
+
+    def __init__(self, tagger, max_batch_size=32, max_wait_ms=10, max_pending=256):
+        self.tagger = tagger
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.queue = asyncio.Queue()
+        self.pending = 0
+        self.stats = {"requests": 0, "sentences": 0, "batches": 0, "rejected": 0}
+        # A request taken off the queue that did not fit the previous batch
+        self.carry = None
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+
+    def full(self):
+        return self.pending >= self.max_pending
+
+    async def submit(self, sentences):
+        """Spans for `sentences`, tagged together with whatever else is queued"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        self.stats["requests"] += 1
+        self.queue.put_nowait((sentences, future))
+        try:
+            return await future
+        finally:
+            self.pending -= 1
+
+    async def next_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires.
+
+        Batches never exceed max_batch_size sentences unless a single request does.
+        """
+        if self.carry is not None:
+            batch, self.carry = [self.carry], None
+        else:
+            batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                self.carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            # Requests whose client went away are dropped before inference
+            batch = [(sentences, future) for sentences, future in batch if not future.done()]
+            if not batch:
+                continue
+            sentences = [sentence for request, _ in batch for sentence in request]
+            try:
+                results = await loop.run_in_executor(None, self.tagger.tag_sentences, sentences)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["sentences"] += len(sentences)
+            start = 0
+            for request, future in batch:
+                if not future.done():
+                    future.set_result(results[start:start + len(request)])
+                start += len(request)
+
+
+async def tag(request):
+    batcher = request.app["batcher"]
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Body must be JSON")
+    sentences = payload.get("sentences") if isinstance(payload, dict) else None
+    if not isinstance(sentences, list) or not all(isinstance(s, str) for s in sentences):
+        raise web.HTTPBadRequest(text='Expected {"sentences": [str, ...]}')
+    if len(sentences) > request.app["max_sentences"]:
+        raise web.HTTPRequestEntityTooLarge(max_size=request.app["max_sentences"], actual_size=len(sentences))
+    if not sentences:
+        return web.json_response({"results": []})
+    if batcher.full():
+        batcher.stats["rejected"] += 1
+        raise web.HTTPServiceUnavailable(text="Too many pending requests")
+    return web.json_response({"results": await batcher.submit(sentences)})
+
+
+async def health(request):
+    batcher = request.app["batcher"]
+    stats = batcher.stats
+    return web.json_response({
+        "status": "ok",
+        "model": batcher.tagger.model_path,
+        "pending": batcher.pending,
+        "queued": batcher.queue.qsize(),
+        **stats,
+        "mean_batch_sentences": stats["sentences"] / stats["batches"] if stats["batches"] else 0.0,
+    })
+
+
+def create_app(tagger, max_batch_size=32, max_wait_ms=10, max_pending=256, max_sentences=256):
+    app = web.Application(client_max_size=8 * 2 ** 20)
+    app["batcher"] = MicroBatcher(tagger, max_batch_size, max_wait_ms, max_pending)
+    app["max_sentences"] = max_sentences
+
+    async def start_batcher(app):
+        app["batcher"].start()
+
+    async def stop_batcher(app):
+        await app["batcher"].stop()
+
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    app.router.add_post("/tag", tag)
+    app.router.add_get("/health", health)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model-path", default="V1-model.bin")
+    parser.add_argument("--backend", default="torch", choices=["torch", "quantized", "onnx"])
+    parser.add_argument("--cache", default=None, help="SQLite prediction cache path")
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="sentences per inference batch; a larger single request is tagged alone")
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--max-pending", type=int, default=256)
+    parser.add_argument("--max-sentences", type=int, default=256, help="per request")
+    args = parser.parse_args()
+
+    tagger = get_tagger(args.model_path, backend=args.backend, cache=args.cache,
+                        batch_size=args.max_batch_size)
+    app = create_app(tagger, args.max_batch_size, args.max_wait_ms, args.max_pending, args.max_sentences)
+    print(f"✅ Tagging service on http://{args.host}:{args.port}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
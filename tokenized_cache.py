@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import transformers
+from datasets import Dataset, concatenate_datasets, load_from_disk
+
+from prediction_cache import file_sha256
+
+
+def tokenizer_fingerprint(tagger):
+    """Everything that changes the encodings: vocabulary/normaliser, library version and truncation"""
+    state = json.loads(tagger.tokenizer.backend_tokenizer.to_str())
+    # Truncation/padding are per-call settings the tokenizer remembers after its first use
+    state.pop("truncation", None)
+    state.pop("padding", None)
+    digest = hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8"))
+    digest.update(f"{transformers.__version__}:{tagger.max_length}:{tagger.stride is None}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def tokenized_dataset_path(tagger, input_csv, cache_dir="tokenized_cache"):
+    key = hashlib.sha256(f"{file_sha256(input_csv)}:{tokenizer_fingerprint(tagger)}".encode("utf-8"))
+    return os.path.join(cache_dir, key.hexdigest()[:32])
+
+
+def tokenized_dataset(tagger, input_csv, cache_dir="tokenized_cache", chunk_size=10_000):
+    """Arrow dataset with input_ids and offset_mapping for every ReportingSentence.
+
+    Built once per (input file, tokenizer) and saved under cache_dir; later runs memory-map
+    the saved Arrow files instead of tokenizing again. Row i matches row i of the CSV.
+    """
+    path = tokenized_dataset_path(tagger, input_csv, cache_dir)
+    if os.path.isdir(path):
+        return load_from_disk(path)
+
+    parts = []
+    with pd.read_csv(input_csv, usecols=["ReportingSentence"], chunksize=chunk_size) as reader:
+        for chunk in reader:
+            encodings = tagger.tokenize([str(sentence) for sentence in chunk["ReportingSentence"]])
+            parts.append(Dataset.from_dict({
+                "input_ids": encodings["input_ids"],
+                "offset_mapping": encodings["offset_mapping"],
+            }))
+    dataset = concatenate_datasets(parts) if parts else Dataset.from_dict({"input_ids": [], "offset_mapping": []})
+
+    # Save beside the final path, then rename, so concurrent runs never load a half-written copy
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    dataset.save_to_disk(tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another run finished the same dataset first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    print(f"✅ Tokenized {len(dataset)} sentences into '{path}'")
+    return load_from_disk(path)
+
+
+def list_rows(column):
+    """Rows of a list<int> or list<list<int>> Arrow column as numpy views of its buffers"""
+    rows = []
+    for chunk in column.chunks:
+        if len(chunk) == 0:
+            continue
+        # Offsets are absolute positions in chunk.values, which ignores the chunk's own slice
+        offsets = chunk.offsets.to_numpy()
+        values = chunk.values
+        if pa.types.is_list(values.type):
+            # offset_mapping: one (start, end) pair per token, viewed as an [n, 2] array
+            pair_offsets = values.offsets.to_numpy()
+            values = values.values.to_numpy()[pair_offsets[0]:pair_offsets[-1]].reshape(-1, 2)
+        else:
+            values = values.to_numpy()
+        rows.extend(np.split(values[offsets[0]:offsets[-1]], offsets[1:-1] - offsets[0]))
+    return rows
+
+
+def tokenized_rows(dataset, start, stop):
+    """input_ids and offset_mapping of rows [start, stop) without leaving the memory-mapped buffers.
+
+    Indexing the Dataset itself would convert every token of every row to Python objects.
+    """
+    table = dataset.data.table.slice(start, stop - start)
+    return {name: list_rows(table.column(name)) for name in ("input_ids", "offset_mapping")}